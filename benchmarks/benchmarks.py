@@ -0,0 +1,75 @@
+"""Benchmarks of pynverse, to be run with asv (airspeed velocity).
+
+The cases are the functions of the test suite: the whole real line (cube),
+closed (square) and open (log10) ends of the domain, both ends open (tan),
+and a decreasing function (cos).
+
+"""
+import numpy as np
+
+from pynverse import inversefunc
+
+CASES = {
+    'cube': (lambda x: x**3, {}, (-1e3, 1e3)),
+    'square': (lambda x: x**2, {'domain': 0}, (0., 1e3)),
+    'log10': (np.log10, {'domain': 0, 'open_domain': True,
+                         'image': [-np.inf, None]}, (-10., 10.)),
+    'tan': (np.tan, {'domain': [-np.pi / 2, np.pi / 2],
+                     'open_domain': True}, (-1e3, 1e3)),
+    'cos': (np.cos, {'domain': [0, np.pi]}, (-1., 1.)),
+}
+METHODS = ['brent', 'vectorized', 'table', 'chebyshev']
+SIZES = [1, 100, 10**4, 10**6, 10**7]
+
+# Largest batch solved with each method, as the time per value of 'brent'
+# makes larger batches impractical
+MAX_SIZE = {'brent': 10**4}
+
+
+def _values(case, size):
+    ymin, ymax = CASES[case][2]
+    return np.random.RandomState(0).uniform(ymin, ymax, size)
+
+
+class Setup(object):
+    """Time to build the inverse, including any table or approximation."""
+    params = [sorted(CASES), METHODS]
+    param_names = ['case', 'method']
+
+    def time_inversefunc(self, case, method):
+        func, kwargs, _ = CASES[case]
+        inversefunc(func, method=method, **kwargs)
+
+
+class Inverse(object):
+    """Throughput of the inverse for batches of values."""
+    params = [sorted(CASES), METHODS, SIZES]
+    param_names = ['case', 'method', 'size']
+    timeout = 600
+
+    def setup(self, case, method, size):
+        if size > MAX_SIZE.get(method, size):
+            raise NotImplementedError
+        func, kwargs, _ = CASES[case]
+        self.records = []
+        self.inv = inversefunc(func, method=method,
+                               callback=self.records.append, **kwargs)
+        self.y = _values(case, size)
+
+    def time_inverse(self, case, method, size):
+        self.inv(self.y)
+
+    def peakmem_inverse(self, case, method, size):
+        self.inv(self.y)
+
+    def track_nfev(self, case, method, size):
+        """Evaluations of the function per value, solving and verifying."""
+        self.inv(self.y)
+        record = self.records[-1]
+        return float(record['nfev'] + record['nfev_verify']) / size
+    track_nfev.unit = 'evaluations'
+
+
+def timeraw_import_pynverse():
+    """Time to import pynverse in a new interpreter."""
+    return "import pynverse"
@@ -0,0 +1,122 @@
+import asyncio
+from collections import deque
+
+import numpy as np
+
+from ._streaming import _chunk_bounds
+
+__all__ = []
+
+
+class _Batcher(object):
+    r"""Combines the chunks of the concurrent asynchronous requests to an
+    inverse into shared batches.
+
+    The chunks are queued in order of arrival, and solved in batches of
+    whole chunks with at most `chunk_size` values (or a single larger
+    chunk), one batch at a time in the `executor`, so the requests that
+    arrive while a batch is being solved are combined into the next one.
+    Chunks whose requests were cancelled are skipped. The batcher removes
+    itself from the batchers of the inverse when its queue is empty.
+
+    """
+
+    def __init__(self, inv, key, loop, executor, chunk_size):
+        self.inv = inv
+        self.key = key
+        self.loop = loop
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.pending = deque()
+        self.task = None
+
+    def submit(self, yv):
+        """Queues the values, returning the future of their inverse."""
+        future = self.loop.create_future()
+        self.pending.append((yv, future))
+        if self.task is None:
+            self.task = self.loop.create_task(self._run())
+        return future
+
+    def _next_batch(self):
+        batch = []
+        size = 0
+        while self.pending:
+            yv, future = self.pending[0]
+            if future.done():
+                self.pending.popleft()
+                continue
+            if batch and size + yv.size > self.chunk_size:
+                break
+            self.pending.popleft()
+            batch.append((yv, future))
+            size += yv.size
+        return batch
+
+    async def _run(self):
+        try:
+            while True:
+                batch = self._next_batch()
+                if not batch:
+                    break
+                await self._solve_batch(batch)
+        finally:
+            self.inv._batchers.pop(self.key, None)
+            for _, future in self.pending:
+                future.cancel()
+            self.pending.clear()
+
+    async def _solve_batch(self, batch):
+        values = np.concatenate([yv for yv, _ in batch])
+        try:
+            xv = await self.loop.run_in_executor(self.executor, self.inv,
+                                                 values)
+        except Exception as error:
+            if len(batch) > 1:
+                # Solving the chunks one by one, so the error only reaches
+                # the requests with the values that caused it
+                for chunk in batch:
+                    await self._solve_batch([chunk])
+            elif not batch[0][1].done():
+                batch[0][1].set_exception(error)
+            return
+        start = 0
+        for yv, future in batch:
+            end = start + yv.size
+            if not future.done():
+                future.set_result(xv[start:end])
+            start = end
+
+
+async def _solve_chunks(inv, yin, executor, chunk_size):
+    loop = asyncio.get_running_loop()
+    key = (loop, executor, chunk_size)
+    yflat = yin.reshape(-1)
+    xflat = np.empty(yflat.shape)
+    for start, end in _chunk_bounds(yflat.size, chunk_size):
+        # The batcher may have been removed while waiting for the last
+        # chunk, when no other requests were queued
+        batcher = inv._batchers.get(key)
+        if batcher is None:
+            batcher = _Batcher(inv, key, loop, executor, chunk_size)
+            inv._batchers[key] = batcher
+        xflat[start:end] = await batcher.submit(yflat[start:end])
+    return xflat.reshape(yin.shape)
+
+
+async def _solve_async(inv, y_values, executor, chunk_size, timeout):
+    r"""Inverse of the values, solved in chunks of at most `chunk_size`
+    values in the `executor`, combined with the chunks of any concurrent
+    request to the same inverse, and waiting for each chunk to be solved
+    without blocking the event loop.
+
+    Cancelling the request, or exceeding the `timeout` in seconds, drops
+    its chunks that have not been solved yet. The batch being solved in
+    the executor, if any, cannot be interrupted and runs to completion.
+
+    """
+    yin = np.asarray(y_values, dtype=np.float64)
+    coro = _solve_chunks(inv, yin, executor, chunk_size)
+    if timeout is None:
+        return await coro
+    return await asyncio.wait_for(coro, timeout)
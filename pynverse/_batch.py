@@ -0,0 +1,114 @@
+import warnings
+
+import numpy as np
+
+__all__ = []
+
+
+def _normparams_batch(domain, image, batch_shape):
+    r"""Normalizes the `domain` and the `image` of a batch of functions.
+
+    Each of the ends may be None, a scalar or an array broadcastable to
+    `batch_shape`. The domain is returned as a pair of arrays with the
+    shape of the batch, using -Inf/Inf for the ends not given, and the
+    image as a pair of such arrays or None for the ends not given.
+
+    """
+    def ends(pair, name):
+        if pair is None:
+            pair = (None, None)
+        elif not isinstance(pair, (list, tuple)) and np.ndim(pair) == 0:
+            pair = (pair, None)
+        if len(pair) != 2:
+            raise ValueError("%s must be a single scalar, or have two "
+                             "elements, each of them None, a scalar or an "
+                             "array broadcastable to batch_shape" % name)
+        try:
+            return tuple(None if end is None else
+                         np.broadcast_to(np.asarray(end, dtype=np.float64),
+                                         batch_shape)
+                         for end in pair)
+        except ValueError:
+            raise ValueError("The ends of %s must be broadcastable to "
+                             "batch_shape %s" % (name, str(batch_shape)))
+
+    xmin, xmax = ends(domain, 'domain')
+    xmin = np.full(batch_shape, -np.inf) if xmin is None else xmin
+    xmax = np.full(batch_shape, np.inf) if xmax is None else xmax
+    if not (xmin < xmax).all():
+        raise ValueError("domain[0] min must be less than domain[1]")
+    ymin, ymax = ends(image, 'image')
+    if ymin is not None and ymax is not None and not (ymin < ymax).all():
+        raise ValueError("image[0] min must be less than image[1]")
+    return (xmin, xmax), (ymin, ymax)
+
+
+def _batch_refpoints(xmin, xmax):
+    # Same reference points as _get_valid_refpoints, for each of the
+    # channels
+    lower, upper = np.isfinite(xmin), np.isfinite(xmax)
+    with np.errstate(invalid='ignore'):
+        d = xmax - xmin
+        ref1 = np.where(lower & upper, xmin + d / 4.,
+                        np.where(lower, xmin + 1.,
+                                 np.where(upper, xmax - 2., 0.)))
+        ref2 = np.where(lower & upper, xmax - d / 4.,
+                        np.where(lower, xmin + 2.,
+                                 np.where(upper, xmax - 1., 1.)))
+    return ref1, ref2
+
+
+def _batch_end(func, args, xend, ref, sign, batch_shape):
+    # Value of each of the functions at an end of its domain, or sign * Inf
+    # for the infinite ends and where it cannot be evaluated. The channels
+    # with infinite ends are evaluated at their reference point instead
+    finite = np.isfinite(xend)
+    with np.errstate(all='ignore'):
+        with warnings.catch_warnings(record=True):
+            fx = np.broadcast_to(func(np.where(finite, xend, ref), *args),
+                                 batch_shape).astype(np.float64)
+    return np.where(finite & ~np.isnan(fx), fx, sign * np.inf)
+
+
+def _broadcast_batch(yin, batch_shape):
+    # Values with the shape of the batch followed by the shape of the
+    # values of each of the functions
+    nbatch = len(batch_shape)
+    try:
+        if yin.ndim < nbatch:
+            return np.broadcast_to(yin, batch_shape)
+        return np.broadcast_to(yin, batch_shape + yin.shape[nbatch:])
+    except ValueError:
+        raise ValueError("The leading dimensions of the values must be "
+                         "broadcastable to batch_shape %s" %
+                         str(batch_shape))
+
+
+def _channel_values(a, shape, batch_shape):
+    # Flattened array with the value of the channel of each of the values
+    # in an array with the given shape
+    a = np.reshape(a, batch_shape + (1,) * (len(shape) - len(batch_shape)))
+    return np.broadcast_to(a, shape).reshape(-1)
+
+
+class _ChannelFunc(object):
+    r"""Function of the elements `idx` of a batch of values, for the
+    elementwise solvers.
+
+    Every call writes the points into `buffer`, which keeps the last point
+    evaluated for each of the values, and evaluates `func` once with the
+    whole buffer, with the shape of the values, as the functions of the
+    batch are only defined for all the channels at once.
+
+    """
+
+    def __init__(self, func, args, buffer, shape):
+        self.func = func
+        self.args = args
+        self.buffer = buffer
+        self.shape = shape
+
+    def __call__(self, x, idx):
+        self.buffer[idx] = x
+        fx = self.func(self.buffer.reshape(self.shape), *self.args)
+        return np.broadcast_to(fx, self.shape).reshape(-1)[idx]
@@ -0,0 +1,73 @@
+import numpy as np
+import threading
+from collections import OrderedDict, namedtuple
+
+__all__ = []
+
+_CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions',
+                                      'maxsize', 'currsize'])
+
+
+class _LRUCache(object):
+    r"""Thread-safe least recently used map from values to their inverse.
+
+    The keys are the bits of the values as float64, so only exact repeats
+    of the values are found. Lookups and insertions work with whole
+    arrays of values, holding the lock only once per array.
+
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(yin):
+        return np.ascontiguousarray(yin, dtype=np.float64).view(
+            np.int64).tolist()
+
+    def lookup(self, yin):
+        """Returns the cached inverse of the values, and the mask of the
+        values that were found."""
+        results = np.empty(yin.shape)
+        found = np.zeros(yin.shape, dtype=bool)
+        with self._lock:
+            data = self._data
+            for i, key in enumerate(self._keys(yin)):
+                x = data.get(key)
+                if x is not None:
+                    data.move_to_end(key)
+                    results[i] = x
+                    found[i] = True
+            hits = int(found.sum())
+            self.hits += hits
+            self.misses += yin.size - hits
+        return results, found
+
+    def store(self, yin, xout):
+        """Caches the inverse `xout` of the values `yin`, evicting the least
+        recently used values above the maximum size."""
+        with self._lock:
+            data = self._data
+            for key, x in zip(self._keys(yin), xout.tolist()):
+                data[key] = x
+                data.move_to_end(key)
+            while len(data) > self.maxsize:
+                data.popitem(last=False)
+                self.evictions += 1
+
+    def info(self):
+        with self._lock:
+            return _CacheInfo(self.hits, self.misses, self.evictions,
+                              self.maxsize, len(self._data))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
@@ -0,0 +1,168 @@
+import numpy as np
+
+from ._tables import _save_arrays, _load_arrays
+
+__all__ = []
+
+
+def _chebyshev_nodes(lo, hi, degree, check=False):
+    # Chebyshev points of the first kind in each of the intervals [lo, hi],
+    # or the Chebyshev points of the second kind interleaved with them
+    if check:
+        theta = np.pi * np.arange(degree + 1) / degree
+    else:
+        theta = np.pi * (np.arange(degree) + 0.5) / degree
+    half = ((hi - lo) / 2.)[:, np.newaxis]
+    mid = ((hi + lo) / 2.)[:, np.newaxis]
+    return mid + half * np.cos(theta)
+
+
+def _chebyshev_coefs(values):
+    # Chebyshev coefficients of the interpolants through the values at the
+    # Chebyshev points of the first kind (last axis), with the first one
+    # already halved
+    degree = values.shape[-1]
+    theta = np.pi * (np.arange(degree) + 0.5) / degree
+    cosmat = np.cos(np.outer(np.arange(degree), theta))
+    coefs = 2. / degree * np.dot(values, cosmat.T)
+    coefs[..., 0] /= 2.
+    return coefs
+
+
+def _clenshaw(coefs, t):
+    # Evaluates the Chebyshev series with coefficients coefs[i] at t[i]
+    b1 = np.zeros(t.shape)
+    b2 = np.zeros(t.shape)
+    for k in range(coefs.shape[-1] - 1, 0, -1):
+        b1, b2 = coefs[:, k] + 2 * t * b1 - b2, b1
+    return coefs[:, 0] + t * b1 - b2
+
+
+def _split_point(lo, hi):
+    # Bisection in the variable asinh(y), so images spanning many orders
+    # of magnitude are split geometrically
+    return np.sinh((np.arcsinh(lo) + np.arcsinh(hi)) / 2.)
+
+
+class _ChebyshevInverse(object):
+    r"""Piecewise Chebyshev approximation of an inverse function.
+
+    `breaks` contains the limits in y of the pieces in ascending order, and
+    `coefs` the Chebyshev coefficients of the inverse in each of them.
+    `valid` flags the pieces where the coefficients decayed below the
+    tolerance.
+
+    """
+
+    def __init__(self, breaks, coefs, valid):
+        self.breaks = breaks
+        self.coefs = coefs
+        self.valid = valid
+
+    def __call__(self, yin):
+        """Returns the approximated values, and the mask of the values that
+        fall into valid pieces."""
+        yin = np.asarray(yin, dtype=np.float64)
+        k = np.clip(np.searchsorted(self.breaks, yin, side='right') - 1,
+                    0, self.breaks.size - 2)
+        inside = ((yin >= self.breaks[0]) & (yin <= self.breaks[-1]) &
+                  self.valid[k])
+        lo, hi = self.breaks[k], self.breaks[k + 1]
+        with np.errstate(all='ignore'):
+            t = np.clip((2 * yin - (lo + hi)) / (hi - lo), -1., 1.)
+            xout = _clenshaw(self.coefs[k], t)
+        return xout, inside
+
+    _arrays = ('breaks', 'coefs', 'valid')
+
+    def save(self, path):
+        """Saves the approximation as `.npy` files in the directory
+        `path`."""
+        _save_arrays(path, dict((name, getattr(self, name))
+                                for name in self._arrays))
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Loads an approximation saved with `save`, optionally as memory
+        maps."""
+        return cls(*_load_arrays(path, cls._arrays, mmap_mode))
+
+
+def _build_chebyshev(solve, ylo, yhi, tolerance, degree=16, max_depth=60,
+                     max_pieces=2**16, max_span=2., f=None, ytolerance=None):
+    r"""Fit a piecewise Chebyshev approximation of an inverse function.
+
+    Starting with the image interval [`ylo`, `yhi`], the inverse is solved
+    at the Chebyshev points of every piece using `solve`, which takes an
+    ndarray of y values and returns the inverse values and a mask of the
+    successful ones. All the pieces of the same level are solved in a
+    single call. Pieces whose last coefficients do not decay below
+    `tolerance` (relative for values of x larger than 1), or whose error
+    at the ends and at the check points in between the Chebyshev points is
+    larger than `tolerance`, are bisected until `max_depth` levels or
+    `max_pieces` pieces are reached. With `f` and `ytolerance`, the
+    residual of `f` at the approximation of the check points must be
+    within `ytolerance` too, unless the approximation is as accurate as
+    the solvers. Pieces are also bisected while they span more than
+    `max_span` in the variable asinh(y).
+
+    """
+    lo = np.array([ylo], dtype=np.float64)
+    hi = np.array([yhi], dtype=np.float64)
+    done_lo, done_hi, done_coefs, done_valid = [], [], [], []
+    npieces = 0
+    for depth in range(max_depth):
+        # Solving both at the interpolation points and at the check points
+        # in between them with a single call
+        nodes = _chebyshev_nodes(lo, hi, degree)
+        check = _chebyshev_nodes(lo, hi, degree, check=True)
+        x, success = solve(np.concatenate([nodes.ravel(), check.ravel()]))
+        xcheck = x[nodes.size:].reshape(check.shape)
+        x = x[:nodes.size].reshape(nodes.shape)
+        success = (success[:nodes.size].reshape(nodes.shape).all(axis=1) &
+                   success[nodes.size:].reshape(check.shape).all(axis=1))
+        coefs = _chebyshev_coefs(np.where(np.isfinite(x), x, 0.))
+        scale = np.maximum(1., np.min(np.abs(x), axis=1))
+        tail = np.max(np.abs(coefs[:, -3:]), axis=1)
+        t = np.cos(np.pi * np.arange(degree + 1) / degree)
+        with np.errstate(all='ignore'):
+            approx = _clenshaw(np.repeat(coefs, degree + 1, axis=0),
+                               np.tile(t, lo.size))
+            error = np.abs(approx - xcheck.ravel())
+            if f is not None and ytolerance is not None:
+                # Same residual as the verification of the inverse
+                yp = np.asarray(f(approx), dtype=np.float64) * np.ones(
+                    approx.shape)
+                yerror = np.abs(yp - check.ravel())
+                ygood = ((yerror <= 0.25 * ytolerance) |
+                         (error <= 1e-11 + 1.48e-08 * np.abs(approx)))
+                success &= ygood.reshape(check.shape).all(axis=1)
+        error = np.max(error.reshape(check.shape), axis=1)
+        # Pieces spanning many orders of magnitude are always split, as
+        # the function may vary in a tiny fraction of them unnoticed
+        narrow = np.arcsinh(hi) - np.arcsinh(lo) <= max_span
+        converged = (success & narrow & (tail <= tolerance * scale) &
+                     (error <= tolerance * scale))
+
+        mid = _split_point(lo, hi)
+        splittable = (mid > lo) & (mid < hi)
+        last = (depth == max_depth - 1 or
+                npieces + 2 * lo.size > max_pieces)
+        final = converged | ~splittable | last
+        npieces += final.sum()
+        done_lo.append(lo[final])
+        done_hi.append(hi[final])
+        done_coefs.append(coefs[final])
+        done_valid.append(converged[final])
+
+        split = ~final
+        if not split.any():
+            break
+        lo, hi = (np.concatenate([lo[split], mid[split]]),
+                  np.concatenate([mid[split], hi[split]]))
+
+    lo = np.concatenate(done_lo)
+    order = np.argsort(lo)
+    breaks = np.append(lo[order], np.concatenate(done_hi)[order][-1])
+    return _ChebyshevInverse(breaks, np.concatenate(done_coefs)[order],
+                             np.concatenate(done_valid)[order])
@@ -0,0 +1,157 @@
+import os
+
+import numpy as np
+
+from ._tables import (_hermite_eval, _pchip_slopes, _save_arrays,
+                      _load_arrays)
+
+__all__ = []
+
+_KINDS = ('linear', 'pchip')
+
+
+def _check_samples(x, y, trend=None, chunk_size=2**20):
+    r"""Checks that the samples `x` are strictly increasing and `y` strictly
+    monotonic, reading them in chunks of at most `chunk_size` values, so
+    memory maps are never loaded at once. Returns the trend of `y`.
+
+    """
+    if x.ndim != 1 or y.shape != x.shape:
+        raise ValueError("x and y must be 1-D arrays of the same size")
+    if x.size < 2:
+        raise ValueError("At least two samples are required")
+    sign = np.sign(float(y[-1]) - float(y[0]))
+    if trend is None:
+        trend = sign
+    elif trend not in (1, -1):
+        raise ValueError("trend must be 1 or -1")
+    if sign != trend:
+        raise ValueError("The samples are not strictly %s" %
+                         ('increasing' if trend == 1 else 'decreasing'))
+    for start in range(0, x.size - 1, chunk_size):
+        end = min(start + chunk_size + 1, x.size)
+        if not (np.diff(x[start:end]) > 0).all():
+            raise ValueError("x must be strictly increasing")
+        if not (trend * np.diff(y[start:end]) > 0).all():
+            raise ValueError("The samples are not strictly monotonic")
+    return int(trend)
+
+
+def _chunked_pchip_slopes(xk, yk, chunk_size=2**20):
+    # Same as _pchip_slopes, computed in chunks overlapping by one sample at
+    # each side, as the slopes inside only depend on the neighbours. The
+    # windows are at least three samples wide, as the slopes at the ends
+    # depend on the two nearest intervals
+    n = xk.size
+    if n <= chunk_size:
+        return _pchip_slopes(np.asarray(xk, dtype=np.float64),
+                             np.asarray(yk, dtype=np.float64))
+    d = np.empty(n)
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        lo = max(min(start - 1, n - 3), 0)
+        hi = min(max(end + 1, lo + 3), n)
+        xc = np.asarray(xk[lo:hi], dtype=np.float64)
+        yc = np.asarray(yk[lo:hi], dtype=np.float64)
+        d[start:end] = _pchip_slopes(xc, yc)[start - lo:end - lo]
+    return d
+
+
+def _interval(yk, yin, trend):
+    # Index of the interval of the samples `yk` containing each value, as
+    # np.searchsorted(trend * yk, trend * yin, side='right') - 1, clipped
+    # to the intervals. Decreasing samples are bisected in place, reading
+    # only the samples visited, instead of searching a reversed copy
+    n = yk.size
+    if trend == 1:
+        k = np.searchsorted(yk, yin, side='right')
+    else:
+        lo = np.zeros(yin.shape, dtype=np.intp)
+        hi = np.full(yin.shape, n, dtype=np.intp)
+        tyin = trend * yin
+        while True:
+            active = lo < hi
+            if not active.any():
+                break
+            mid = (lo + hi) // 2
+            right = active & (trend * yk[np.minimum(mid, n - 1)] <= tyin)
+            lo = np.where(right, mid + 1, lo)
+            hi = np.where(active & ~right, mid, hi)
+        k = lo
+    return np.clip(k - 1, 0, n - 2)
+
+
+class _SampleTable(object):
+    r"""Linear, or monotone piecewise cubic Hermite, interpolant of the
+    inverse of monotonic samples.
+
+    `x` contains the samples in ascending order, `y` the values of the
+    function there, with the given `trend`, and `dxdy` the derivatives of
+    the inverse for the cubic interpolant, or None for the linear one.
+    The arrays may be memory maps, as only the samples around the values
+    are read.
+
+    """
+
+    def __init__(self, y, x, trend, dxdy=None):
+        self.y = y
+        self.x = x
+        self.trend = trend
+        self.dxdy = dxdy
+
+    def __call__(self, yin):
+        """Returns the interpolated values, and the mask of the values that
+        fall inside the samples."""
+        yin = np.asarray(yin, dtype=np.float64)
+        y, x, trend = self.y, self.x, int(self.trend)
+        k = _interval(y, yin, trend)
+        ya = np.asarray(y[k], dtype=np.float64)
+        yb = np.asarray(y[k + 1], dtype=np.float64)
+        inside = ((trend * yin >= trend * float(y[0])) &
+                  (trend * yin <= trend * float(y[-1])))
+        with np.errstate(all='ignore'):
+            if self.dxdy is None:
+                xa, xb = x[k], x[k + 1]
+                xout = xa + (yin - ya) * ((xb - xa) / (yb - ya))
+            else:
+                xout = _hermite_eval(y, x, self.dxdy, yin, k)
+        return xout, inside
+
+    def save(self, path):
+        """Saves the samples as `.npy` files in the directory `path`."""
+        arrays = {'y': self.y, 'x': self.x, 'trend': np.array(self.trend)}
+        if self.dxdy is not None:
+            arrays['dxdy'] = self.dxdy
+        _save_arrays(path, arrays)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Loads samples saved with `save`, optionally as memory maps."""
+        y, x, trend = _load_arrays(path, ('y', 'x', 'trend'), mmap_mode)
+        dxdy = None
+        if os.path.exists(os.path.join(path, 'dxdy.npy')):
+            dxdy, = _load_arrays(path, ('dxdy',), mmap_mode)
+        return cls(y, x, int(trend), dxdy)
+
+
+class _SampleFunction(object):
+    r"""Linear interpolation of the samples of a monotonic function, the
+    forward function of the inverse of a `_SampleTable`. The samples are
+    not pickled, so they are only saved once with the inverse."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getstate__(self):
+        # The samples are saved with the inverse, which sets them back
+        return {'table': None}
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        xk, yk = self.table.x, self.table.y
+        k = np.clip(np.searchsorted(xk, x, side='right') - 1, 0, xk.size - 2)
+        xa = np.asarray(xk[k], dtype=np.float64)
+        xb = np.asarray(xk[k + 1], dtype=np.float64)
+        ya, yb = yk[k], yk[k + 1]
+        with np.errstate(all='ignore'):
+            return ya + (x - xa) * ((yb - ya) / (xb - xa))
@@ -0,0 +1,275 @@
+import numpy as np
+
+__all__ = []
+
+
+def _expand_brackets(fun, lo, hi, glo, ghi, xmin=None, xmax=None,
+                     maxiter=2100, exhausted=None):
+    r"""Expand the intervals [`lo`, `hi`] until they bracket a root.
+
+    `fun(x, idx)` must return the values of an increasing function `g` at
+    the points `x` for the elements `idx` of the problem. On exit, every
+    element fulfilling `glo <= 0 <= ghi` is a valid bracket. The intervals
+    grow geometrically, but never beyond `xmin` and `xmax` when given,
+    which may be arrays with a limit for each of the elements.
+    `exhausted(idx)`, when given, returns the mask of the elements `idx`
+    that must not be evaluated any more, which are left without bracket.
+    All the arrays are modified in place.
+
+    """
+    width = hi - lo
+    for _ in range(maxiter):
+        if exhausted is not None:
+            pending = np.flatnonzero((glo > 0) | (ghi < 0))
+            stopped = pending[exhausted(pending)]
+            glo[stopped] = np.nan
+            ghi[stopped] = np.nan
+        down = np.flatnonzero(glo > 0)
+        up = np.flatnonzero(ghi < 0)
+        if down.size == 0 and up.size == 0:
+            break
+        if down.size > 0:
+            hi[down] = lo[down]
+            ghi[down] = glo[down]
+            lo[down] = lo[down] - width[down]
+            if xmin is not None:
+                lo[down] = np.maximum(lo[down], xmin if np.ndim(xmin) == 0
+                                      else xmin[down])
+            width[down] *= 2
+        if up.size > 0:
+            lo[up] = hi[up]
+            glo[up] = ghi[up]
+            hi[up] = hi[up] + width[up]
+            if xmax is not None:
+                hi[up] = np.minimum(hi[up], xmax if np.ndim(xmax) == 0
+                                    else xmax[up])
+            width[up] *= 2
+        # A single evaluation for both directions, as an increasing g
+        # cannot be positive at lo and negative at hi
+        with np.errstate(all='ignore'):
+            gnew = fun(np.concatenate([lo[down], hi[up]]),
+                       np.concatenate([down, up]))
+        glo[down] = gnew[:down.size]
+        ghi[up] = gnew[down.size:]
+        # Intervals that run away to infinity or that already reached the
+        # limits without finding a sign change cannot bracket anything
+        lost = ~(np.isfinite(lo) & np.isfinite(hi))
+        if xmin is not None:
+            lost |= (lo <= xmin) & (glo > 0)
+        if xmax is not None:
+            lost |= (hi >= xmax) & (ghi < 0)
+        glo[lost] = np.nan
+        ghi[lost] = np.nan
+    return (glo <= 0) & (ghi >= 0)
+
+
+def _illinois(fun, lo, hi, glo, ghi, xtol=1e-11, rtol=1.48e-08,
+              maxiter=500, exhausted=None):
+    r"""Find the roots of an increasing function for many brackets at once.
+
+    Runs the Illinois variant of the regula falsi method in lockstep on all
+    the elements, so each iteration performs a single call to `fun` with
+    the points that have not converged yet. A bisection step is taken
+    whenever the interpolation is not possible (e.g. infinite values at an
+    open end of the domain).
+
+    Parameters
+    ----------
+    fun : callable
+        `fun(x, idx)` returns the values of the increasing function `g` at
+        the points `x` for the elements `idx` of the problem.
+    lo, hi : ndarray
+        Brackets of the roots, with `glo <= 0 <= ghi`.
+    glo, ghi : ndarray
+        Values of `g` at `lo` and `hi`.
+    xtol, rtol : float, optional
+        Absolute and relative tolerance in the root.
+    maxiter : int, optional
+        Maximum number of iterations.
+    exhausted : callable, optional
+        `exhausted(idx)` returns the boolean mask of the elements `idx`
+        that ran out of evaluations or time. They are stopped before the
+        next iteration with the best estimate in their bracket, and are not
+        converged.
+
+    Returns
+    -------
+    x : ndarray
+        Best estimate of the roots.
+    converged : ndarray
+        Boolean mask of the elements that met the tolerance.
+    nit : ndarray
+        Number of iterations of each element, each of them a single
+        evaluation of `g` (the evaluations made to find the brackets are
+        not included).
+    residual : ndarray
+        Absolute value of `g` at the returned estimates.
+
+    """
+    nit = np.zeros(lo.shape, dtype=int)
+    valid = (glo <= 0) & (ghi >= 0)
+    with np.errstate(invalid='ignore'):
+        x = np.where(np.abs(glo) <= np.abs(ghi), lo, hi)
+        residual = np.minimum(np.abs(glo), np.abs(ghi))
+    x[~valid] = np.nan
+    residual[~valid] = np.nan
+    converged = valid & ((glo == 0) | (ghi == 0))
+
+    # Work on compact copies of the elements still active, so the cost of
+    # each iteration only depends on the number of points left
+    active = np.flatnonzero(valid & ~converged)
+    a, b = lo[active], hi[active]
+    ga, gb = glo[active], ghi[active]
+    side = np.zeros(active.shape, dtype=int)
+    # The Illinois steps alter the values kept at the ends, so the best
+    # point evaluated so far is tracked on its own
+    xbest, gbest = x[active], residual[active]
+    for _ in range(maxiter):
+        if exhausted is not None and active.size > 0:
+            stop = exhausted(active)
+            if stop.any():
+                idx = active[stop]
+                x[idx] = xbest[stop]
+                residual[idx] = gbest[stop]
+                keep = ~stop
+                active = active[keep]
+                a, b, ga, gb = a[keep], b[keep], ga[keep], gb[keep]
+                side, xbest, gbest = side[keep], xbest[keep], gbest[keep]
+        if active.size == 0:
+            break
+        xn = a + (b - a) / 2.
+        with np.errstate(all='ignore'):
+            xs = b - (b - a) * (gb / (gb - ga))
+        use = (np.isfinite(ga) & np.isfinite(gb) & (xs > a) & (xs < b))
+        xn[use] = xs[use]
+        with np.errstate(all='ignore'):
+            gn = fun(xn, active)
+        nit[active] += 1
+        better = np.abs(gn) < gbest
+        xbest[better] = xn[better]
+        gbest[better] = np.abs(gn[better])
+
+        left = gn < 0
+        right = gn > 0
+        # Illinois step: halve the value at the end retained twice in a row
+        gb[left & (side == -1)] /= 2.
+        ga[right & (side == 1)] /= 2.
+        side = np.where(left, -1, np.where(right, 1, 0))
+        a[left] = xn[left]
+        ga[left] = gn[left]
+        b[right] = xn[right]
+        gb[right] = gn[right]
+
+        zero = gn == 0
+        scale = np.maximum(np.abs(a), np.abs(b))
+        done = zero | (b - a <= xtol + rtol * scale)
+        # No more floating point numbers inside the bracket
+        mid = a + (b - a) / 2.
+        done |= (mid <= a) | (mid >= b)
+        failed = np.isnan(gn)
+
+        finished = done | failed
+        if finished.any():
+            idx = active[finished]
+            x[idx] = xbest[finished]
+            residual[idx] = gbest[finished]
+            converged[active[done & ~failed]] = True
+            keep = ~finished
+            active = active[keep]
+            a, b, ga, gb = a[keep], b[keep], ga[keep], gb[keep]
+            side, xbest, gbest = side[keep], xbest[keep], gbest[keep]
+
+    # Best estimate for the elements that ran out of iterations
+    x[active] = xbest
+    residual[active] = gbest
+    return x, converged, nit, residual
+
+
+def _newton(fun, lo, hi, glo, ghi, dfun, d2fun=None, xtol=1e-11,
+            rtol=1.48e-08, maxiter=100, exhausted=None):
+    r"""Safeguarded Newton or Halley iterations for many brackets at once.
+
+    Same as `_illinois`, but using the derivative `dfun(x, idx)` (and the
+    second derivative `d2fun(x, idx)` for Halley steps) of the increasing
+    function `g`. Every iteration evaluates `fun` and its derivatives once
+    with all the points that have not converged yet, and the brackets are
+    tightened with the sign of `g`. Whenever a step would leave the
+    bracket, a bisection step is taken instead.
+
+    The residual returned for the estimates obtained with a final Newton or
+    Halley step is the one of the point the step was taken from, which
+    bounds it close to the root. The elements stopped by `exhausted` return
+    the next point inside their bracket, with an unknown residual.
+
+    """
+    nit = np.zeros(lo.shape, dtype=int)
+    valid = (glo <= 0) & (ghi >= 0)
+    with np.errstate(invalid='ignore'):
+        x = np.where(np.abs(glo) <= np.abs(ghi), lo, hi)
+        residual = np.minimum(np.abs(glo), np.abs(ghi))
+    x[~valid] = np.nan
+    residual[~valid] = np.nan
+    converged = valid & ((glo == 0) | (ghi == 0))
+
+    active = np.flatnonzero(valid & ~converged)
+    a, b = lo[active], hi[active]
+    ga, gb = glo[active], ghi[active]
+    # Starting at the regula falsi point, or the midpoint of the bracket
+    xn = a + (b - a) / 2.
+    with np.errstate(all='ignore'):
+        xs = b - (b - a) * (gb / (gb - ga))
+    use = np.isfinite(ga) & np.isfinite(gb) & (xs > a) & (xs < b)
+    xn[use] = xs[use]
+    for _ in range(maxiter):
+        if exhausted is not None and active.size > 0:
+            stop = exhausted(active)
+            if stop.any():
+                idx = active[stop]
+                x[idx] = xn[stop]
+                residual[idx] = np.nan
+                keep = ~stop
+                active = active[keep]
+                a, b, xn = a[keep], b[keep], xn[keep]
+        if active.size == 0:
+            break
+        with np.errstate(all='ignore'):
+            gn = fun(xn, active)
+            dn = dfun(xn, active)
+            if d2fun is not None:
+                d2n = d2fun(xn, active)
+        nit[active] += 1
+
+        a[gn < 0] = xn[gn < 0]
+        b[gn > 0] = xn[gn > 0]
+        with np.errstate(all='ignore'):
+            if d2fun is None:
+                step = gn / dn
+            else:
+                step = 2 * gn * dn / (2 * dn * dn - gn * d2n)
+        xnew = xn - step
+        newton = np.isfinite(xnew) & (xnew > a) & (xnew < b)
+        xnew[~newton] = a[~newton] + (b[~newton] - a[~newton]) / 2.
+
+        zero = gn == 0
+        scale = np.maximum(np.abs(a), np.abs(b))
+        done = (zero | (b - a <= xtol + rtol * scale) |
+                (newton & (np.abs(step) <= xtol + rtol * np.abs(xn))))
+        failed = np.isnan(gn)
+
+        finished = done | failed
+        if finished.any():
+            idx = active[finished]
+            x[idx] = np.where(zero[finished] | ~newton[finished],
+                              xn[finished], xnew[finished])
+            residual[idx] = np.abs(gn[finished])
+            converged[active[done & ~failed]] = True
+            keep = ~finished
+            active = active[keep]
+            a, b, xnew = a[keep], b[keep], xnew[keep]
+        xn = xnew
+
+    # The last points of the elements that ran out of iterations were not
+    # evaluated, so their residual is unknown
+    x[active] = xn
+    residual[active] = np.nan
+    return x, converged, nit, residual
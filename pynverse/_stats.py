@@ -0,0 +1,39 @@
+import threading
+
+__all__ = []
+
+# Fields of the record of each call to the inverse, summed in the totals
+_FIELDS = ('values', 'nfev', 'nfev_verify', 'nit', 'failures', 'inaccurate',
+           'time_check', 'time_solve', 'time_verify', 'time_total')
+
+
+class _Stats(object):
+    r"""Thread-safe totals of the records of the calls to an inverse.
+
+    The records are dicts with the `_FIELDS`, summed into the totals, which
+    also count the number of `calls`, and keep the time spent building the
+    inverse as `time_setup`.
+
+    """
+
+    def __init__(self, time_setup=0.):
+        self.time_setup = time_setup
+        self._lock = threading.Lock()
+        self.clear()
+
+    def record(self, record):
+        with self._lock:
+            self._totals['calls'] += 1
+            for name in _FIELDS:
+                self._totals[name] += record[name]
+
+    def totals(self):
+        with self._lock:
+            totals = dict(self._totals)
+        totals['time_setup'] = self.time_setup
+        return totals
+
+    def clear(self):
+        with self._lock:
+            self._totals = dict.fromkeys(_FIELDS, 0)
+            self._totals['calls'] = 0
@@ -0,0 +1,41 @@
+import numpy as np
+
+__all__ = []
+
+
+def _chunk_bounds(size, chunk_size):
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    starts = range(0, size, chunk_size)
+    return [(start, min(start + chunk_size, size)) for start in starts]
+
+
+def _iter_chunks(inv, arrays, chunk_size):
+    r"""Yields the inverse of consecutive chunks of at most `chunk_size`
+    values from each of the arrays, in the order of the flattened arrays,
+    so only one chunk is held in memory at a time."""
+    for yin in arrays:
+        yin = np.asanyarray(yin)
+        # Flattening in memory order is a view for contiguous arrays and
+        # memory maps, so no copy of the whole array is made
+        yflat = yin.ravel(order='K')
+        for start, end in _chunk_bounds(yflat.size, chunk_size):
+            yield inv(yflat[start:end])
+
+
+def _map_file(inv, in_path, out_path, chunk_size):
+    r"""Writes the inverse of the values stored in the `.npy` file
+    `in_path` into a new `.npy` file `out_path` with the same shape, both
+    accessed as memory maps, one chunk of at most `chunk_size` values at a
+    time."""
+    yin = np.load(in_path, mmap_mode='r')
+    fortran_order = np.isfortran(yin)
+    xout = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float64,
+                                     shape=yin.shape,
+                                     fortran_order=fortran_order)
+    yflat = yin.ravel(order='K')
+    xflat = xout.ravel(order='K')
+    for start, end in _chunk_bounds(yflat.size, chunk_size):
+        inv(yflat[start:end], out=xflat[start:end])
+    xout.flush()
+    del xout
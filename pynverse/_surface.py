@@ -0,0 +1,189 @@
+import numpy as np
+
+from ._tables import _build_table, _hermite_eval, _save_arrays, _load_arrays
+
+__all__ = []
+
+
+class _InverseSurface(object):
+    r"""Tables of the inverse of a function `f(x, p)` for a set of values of
+    the parameter `p`, interpolated in `p` with cubic polynomials through
+    four consecutive rows.
+
+    `p` contains the parameters of the rows in ascending order. The tables
+    of all the rows are stored one after the other in `y`, `x`, `dxdy`
+    and `verified` (the intervals after the last node of each row are not
+    verified), the table of the row `i` starting at `offsets[i]`.
+    `pverified` flags the intervals between parameters where the accuracy
+    of the interpolation in `p` was checked to be within the `tolerance`.
+
+    """
+
+    _arrays = ('p', 'offsets', 'y', 'x', 'dxdy', 'verified', 'pverified',
+               'tolerance')
+
+    def __init__(self, p, offsets, y, x, dxdy, verified, pverified,
+                 tolerance):
+        self.tolerance = tolerance
+        self.p = p
+        self.offsets = offsets
+        self.y = y
+        self.x = x
+        self.dxdy = dxdy
+        self.verified = verified
+        self.pverified = pverified
+
+    def _rows(self, rows, yin):
+        # Inverse of the values in the tables of their rows, grouping the
+        # values by row so each table is searched once
+        xout = np.full(yin.shape, np.nan)
+        inside = np.zeros(yin.shape, dtype=bool)
+        tolerance = float(self.tolerance)
+        order = np.argsort(rows, kind='mergesort')
+        cuts = np.flatnonzero(np.diff(rows[order])) + 1
+        for idx in np.split(order, cuts):
+            if idx.size == 0:
+                continue
+            row = rows[idx[0]]
+            start, end = self.offsets[row], self.offsets[row + 1]
+            yk = self.y[start:end]
+            yv = yin[idx]
+            k = np.clip(np.searchsorted(yk, yv, side='right') - 1,
+                        0, yk.size - 2)
+            dk = self.dxdy[start:end]
+            with np.errstate(all='ignore'):
+                xv = _hermite_eval(yk, self.x[start:end], dk, yv, k)
+                # Where x changes by more than the tolerance within a few
+                # units in the last place of y, the values of the rows at
+                # the same y are too noisy to be interpolated in p
+                slope = np.maximum(np.abs(dk[k]), np.abs(dk[k + 1]))
+                wellcond = (slope * np.abs(yv) * 16 * np.finfo(float).eps <=
+                            0.05 * tolerance * np.maximum(1., np.abs(xv)))
+            inside[idx] = ((yv >= yk[0]) & (yv <= yk[-1]) &
+                           self.verified[start:end][k] & wellcond)
+            xout[idx] = xv
+        return xout, inside
+
+    def __call__(self, yin, pin):
+        """Returns the interpolated values, and the mask of the values that
+        fall into verified intervals of the surface."""
+        yin = np.asarray(yin, dtype=np.float64)
+        pin = np.asarray(pin, dtype=np.float64)
+        p = np.asarray(self.p)
+        nrows = p.size
+        j = np.clip(np.searchsorted(p, pin, side='right') - 1, 0, nrows - 2)
+        # The four rows around each interval, shifted at the ends of the
+        # range of parameters
+        first = np.clip(j - 1, 0, nrows - 4)
+        rows = first + np.arange(4)[:, np.newaxis]
+        x, inside = self._rows(rows.ravel(), np.tile(yin, 4))
+        x, inside = x.reshape(rows.shape), inside.reshape(rows.shape)
+        # Lagrange interpolation through the four rows
+        pr = p[rows]
+        xout = np.zeros(yin.shape)
+        with np.errstate(all='ignore'):
+            for m in range(4):
+                weight = np.ones(yin.shape)
+                for k in range(4):
+                    if k != m:
+                        weight *= (pin - pr[k]) / (pr[m] - pr[k])
+                xout += weight * x[m]
+        inside = ((pin >= p[0]) & (pin <= p[-1]) &
+                  np.asarray(self.pverified)[j] & inside.all(axis=0))
+        return xout, inside
+
+    def save(self, path):
+        """Saves the surface as `.npy` files in the directory `path`."""
+        _save_arrays(path, dict((name, getattr(self, name))
+                                for name in self._arrays))
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Loads a surface saved with `save`, optionally as memory maps."""
+        return cls(*_load_arrays(path, cls._arrays, mmap_mode))
+
+
+def _build_surface(f, domain, open_domain, refs, tolerance, prange,
+                   nparams=9, max_params=2**12, max_rounds=30,
+                   ytolerance=None):
+    r"""Tabulate the inverse of a monotonic function `f(x, p)` over a range
+    of the parameter `p`.
+
+    The inverse is tabulated with `_build_table` for `nparams` values of
+    the parameter evenly distributed in `prange`, each row with a tenth of
+    the `tolerance`, and checked in y with `ytolerance` when given. Then
+    the inverse of the row in the middle of every interval between
+    parameters is tabulated too, and compared to the
+    interpolation in `p` of the rest of the rows at its nodes. Intervals
+    where the error is larger than half of the `tolerance`
+    (relative for values of x larger than 1) are split by inserting the
+    middle row, until `max_params` rows are reached. The comparison skips
+    the points where the inverse is ill-conditioned, as they are not
+    interpolated in `p`.
+
+    """
+    def build_row(p):
+        fref1, fref2 = f(refs[0], p), f(refs[1], p)
+        trend = np.sign(fref2 - fref1)
+        if trend == 0 or not np.isfinite(trend):
+            raise ValueError("Function is not strictly monotonic for the "
+                             "parameter %g" % p)
+        return _build_table(lambda x: f(x, p), domain, open_domain, trend,
+                            tolerance / 10., ytolerance=ytolerance)
+
+    pmin, pmax = float(prange[0]), float(prange[1])
+    if not pmin < pmax:
+        raise ValueError("param_range[0] must be less than param_range[1]")
+    params = list(np.linspace(pmin, pmax, nparams))
+    rows = [build_row(p) for p in params]
+    pverified = [False] * (len(params) - 1)
+    pending = [True] * (len(params) - 1)
+    for _ in range(max_rounds):
+        if not any(pending):
+            break
+        surface = _surface_from_rows(params, rows, [True] * len(pverified),
+                                     tolerance)
+        inserts = []
+        for i in np.flatnonzero(pending):
+            pending[i] = False
+            pm = params[i] + (params[i + 1] - params[i]) / 2.
+            if not params[i] < pm < params[i + 1]:
+                continue
+            row = build_row(pm)
+            xp, inside = surface(row.y, np.full(row.y.shape, pm))
+            good = (inside.any() and
+                    np.all((np.abs(xp - row.x) <= 0.5 * tolerance *
+                            np.maximum(1., np.abs(row.x)))[inside]))
+            if good:
+                pverified[i] = True
+            else:
+                inserts.append((i, pm, row))
+        if not inserts or len(params) + len(inserts) > max_params:
+            break
+        # Inserting the middle rows, and flagging the intervals whose
+        # interpolation changes as pending
+        for i, pm, row in inserts[::-1]:
+            params.insert(i + 1, pm)
+            rows.insert(i + 1, row)
+            pverified.insert(i + 1, False)
+            pending.insert(i + 1, False)
+            for k in range(i - 2, i + 4):
+                if 0 <= k < len(pending):
+                    pending[k] = True
+                    pverified[k] = False
+
+    return _surface_from_rows(params, rows, pverified, tolerance)
+
+
+def _surface_from_rows(params, rows, pverified, tolerance):
+    sizes = [row.y.size for row in rows]
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    # Each row has one verified flag less than nodes
+    verified = np.concatenate([np.append(row.verified, False)
+                               for row in rows])
+    return _InverseSurface(np.array(params, dtype=np.float64), offsets,
+                           np.concatenate([row.y for row in rows]),
+                           np.concatenate([row.x for row in rows]),
+                           np.concatenate([row.dxdy for row in rows]),
+                           verified, np.array(pverified, dtype=bool),
+                           np.array(tolerance, dtype=np.float64))
@@ -0,0 +1,251 @@
+import os
+
+import numpy as np
+
+__all__ = []
+
+
+def _save_arrays(path, arrays):
+    # Saves each of the arrays as a `.npy` file in the directory `path`, so
+    # they can be loaded back as memory maps
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for name, value in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), value)
+
+
+def _load_arrays(path, names, mmap_mode=None):
+    return [np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+            for name in names]
+
+
+def _domain_transform(domain, open_domain, scale=1.):
+    r"""Map the interval [-1, 1] onto the domain of the function.
+
+    Returns a callable transforming `u` into `x` and the boolean tuple of
+    whether each of the ends `u=-1` and `u=1` can be evaluated. Infinite
+    ends are reached asymptotically, so any finite set of `u` points in the
+    open interval (-1, 1) maps to finite points of the domain.
+
+    """
+    xmin, xmax = domain
+    if xmin is not None and xmax is not None:
+        center = (xmin + xmax) / 2.
+        half = (xmax - xmin) / 2.
+
+        def to_x(u):
+            return np.clip(center + half * u, xmin, xmax)
+        ends = (not open_domain[0], not open_domain[1])
+    elif xmin is not None:
+        def to_x(u):
+            with np.errstate(divide='ignore'):
+                return xmin + scale * (1 + u) / (1 - u)
+        ends = (not open_domain[0], False)
+    elif xmax is not None:
+        def to_x(u):
+            with np.errstate(divide='ignore'):
+                return xmax - scale * (1 - u) / (1 + u)
+        ends = (False, not open_domain[1])
+    else:
+        def to_x(u):
+            with np.errstate(divide='ignore'):
+                return scale * u / (1 - u * u)
+        ends = (False, False)
+    return to_x, ends
+
+
+def _pchip_slopes(xk, yk):
+    # Derivatives at the nodes of a monotone piecewise cubic Hermite
+    # interpolant: three point estimates, limited with the filter of Hyman
+    # to preserve monotonicity
+    h = np.diff(xk)
+    with np.errstate(over='ignore'):
+        delta = np.diff(yk) / h
+    d = np.zeros(yk.shape)
+    if yk.size == 2:
+        d[:] = delta[0]
+        return d
+    with np.errstate(over='ignore', invalid='ignore'):
+        dint = ((h[1:] * delta[:-1] + h[:-1] * delta[1:]) /
+                (h[:-1] + h[1:]))
+        limit = 3 * np.minimum(np.abs(delta[:-1]), np.abs(delta[1:]))
+    same = (np.sign(delta[1:]) * np.sign(delta[:-1])) > 0
+    d[1:-1] = np.where(same, np.sign(dint) * np.minimum(np.abs(dint), limit),
+                       0.)
+    d[0] = _pchip_edge(h[0], h[1], delta[0], delta[1])
+    d[-1] = _pchip_edge(h[-1], h[-2], delta[-1], delta[-2])
+    return d
+
+
+def _pchip_edge(h0, h1, m0, m1):
+    # One sided three point estimate of the derivative, shape preserving
+    with np.errstate(over='ignore', invalid='ignore'):
+        d = ((2 * h0 + h1) * m0 - h0 * m1) / (h0 + h1)
+    if np.sign(d) != np.sign(m0):
+        d = 0.
+    elif np.sign(m0) != np.sign(m1) and abs(d) > abs(3 * m0):
+        d = 3 * m0
+    return d
+
+
+def _hermite_eval(xk, yk, dk, x, k=None):
+    # Evaluates the cubic Hermite interpolant at x, given the index k of the
+    # interval of each point if already known. If k is given, xk does not
+    # need to be in ascending order
+    if k is None:
+        k = np.clip(np.searchsorted(xk, x, side='right') - 1,
+                    0, xk.size - 2)
+    h = xk[k + 1] - xk[k]
+    t = (x - xk[k]) / h
+    t2 = t * t
+    t3 = t2 * t
+    return ((2 * t3 - 3 * t2 + 1) * yk[k] + (t3 - 2 * t2 + t) * h * dk[k] +
+            (-2 * t3 + 3 * t2) * yk[k + 1] + (t3 - t2) * h * dk[k + 1])
+
+
+class _InverseTable(object):
+    r"""Monotone piecewise cubic Hermite interpolant of an inverse function.
+
+    The nodes `y` are sorted in ascending order, `x` contains the values of
+    the inverse at those nodes and `dxdy` its derivatives. `verified`
+    flags the intervals between nodes where the accuracy of the
+    interpolation was checked to be within the tolerance.
+
+    """
+
+    def __init__(self, y, x, dxdy, verified):
+        self.y = y
+        self.x = x
+        self.dxdy = dxdy
+        self.verified = verified
+
+    def __call__(self, yin):
+        """Returns the interpolated values, and the mask of the values that
+        fall into verified intervals of the table."""
+        yin = np.asarray(yin, dtype=np.float64)
+        k = np.clip(np.searchsorted(self.y, yin, side='right') - 1,
+                    0, self.y.size - 2)
+        inside = ((yin >= self.y[0]) & (yin <= self.y[-1]) &
+                  self.verified[k])
+        with np.errstate(all='ignore'):
+            xout = _hermite_eval(self.y, self.x, self.dxdy, yin, k)
+        return xout, inside
+
+    _arrays = ('y', 'x', 'dxdy', 'verified')
+
+    def save(self, path):
+        """Saves the table as `.npy` files in the directory `path`."""
+        _save_arrays(path, dict((name, getattr(self, name))
+                                for name in self._arrays))
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Loads a table saved with `save`, optionally as memory maps."""
+        return cls(*_load_arrays(path, cls._arrays, mmap_mode))
+
+
+def _build_table(f, domain, open_domain, trend, tolerance, scale=1.,
+                 nodes=33, max_nodes=2**20, max_rounds=100, ytolerance=None):
+    r"""Sample a monotonic function to tabulate its inverse.
+
+    The function is first sampled at `nodes` points evenly distributed in
+    the variable `u` from `_domain_transform`, plus points accumulating
+    towards any open or infinite end of the domain. Then every interval of
+    the table is split in three until the interpolated inverse at 1/3 and
+    2/3 of the interval in y is within `tolerance` (relative for values of
+    x larger than 1) of the true value, and, when `ytolerance` is given,
+    the function at the interpolated inverse is within `ytolerance` of the
+    value in y too (or the interpolated inverse within the tolerance of
+    the solvers, where that is not possible), or until the table reaches
+    `max_nodes` points. Each refinement pass calls `f` once with all the
+    new points, and once more for the check in y. The errors at the check
+    points are required to be within a fourth of the tolerances, as a
+    safety margin for the rest of the points of the interval. Intervals
+    that cannot be verified are left to the solvers.
+
+    """
+    to_x, ends = _domain_transform(domain, open_domain, scale)
+    u = np.linspace(-1., 1., nodes)
+    k = np.arange(5, 53)
+    if not ends[0]:
+        u = np.concatenate([-1. + 2.**-k[::-1], u[1:]])
+    if not ends[1]:
+        u = np.concatenate([u[:-1], 1. - 2.**-k])
+    x = to_x(u)
+    with np.errstate(all='ignore'):
+        y = np.asarray(f(x), dtype=np.float64) * np.ones(x.shape)
+
+    # Keeping only the nodes where the function is finite and strictly
+    # monotonic to float precision
+    ty = trend * y
+    keep = np.isfinite(ty)
+    x, y, ty = x[keep], y[keep], ty[keep]
+    if ty.size > 0:
+        keep = np.ones(ty.shape, dtype=bool)
+        keep[1:] = ty[1:] > np.maximum.accumulate(ty)[:-1]
+        x, y = x[keep], y[keep]
+    if y.size < 2:
+        raise ValueError("Not enough valid points to tabulate the function")
+
+    verified = np.zeros(y.size - 1, dtype=bool)
+    pending = np.ones(y.size - 1, dtype=bool)
+    for _ in range(max_rounds):
+        if not pending.any():
+            break
+        order = slice(None) if trend == 1 else slice(None, None, -1)
+        dxdy = _pchip_slopes(y[order], x[order])[order]
+
+        # Checking the points of the interpolant at 1/3 and 2/3 of each
+        # interval in y, where the effect of the error in the slope at
+        # each of the ends is largest
+        idx = np.flatnonzero(pending)
+        idx2 = np.concatenate([idx, idx])
+        frac = np.repeat([1. / 3, 2. / 3], idx.size)
+        xa, xb = x[idx2], x[idx2 + 1]
+        with np.errstate(all='ignore'):
+            xm = _hermite_eval(y, x, dxdy, y[idx2] + frac *
+                               (y[idx2 + 1] - y[idx2]), idx2)
+        fallback = ~((xm > xa) & (xm < xb))
+        xm[fallback] = (xa + frac * (xb - xa))[fallback]
+        with np.errstate(all='ignore'):
+            ym = np.asarray(f(xm), dtype=np.float64) * np.ones(xm.shape)
+            xp = _hermite_eval(y, x, dxdy, ym, idx2)
+            good = (np.abs(xp - xm) <=
+                    0.25 * tolerance * np.maximum(1., np.abs(xm)))
+            if ytolerance is not None:
+                # Same residual as the verification of the inverse, unless
+                # the interpolation is as accurate in x as the solvers,
+                # where the residual cannot be any smaller
+                yp = np.asarray(f(xp), dtype=np.float64) * np.ones(xp.shape)
+                good &= ((np.abs(yp - ym) <= 0.25 * ytolerance) |
+                         (np.abs(xp - xm) <= 1e-11 + 1.48e-08 * np.abs(xm)))
+        tya, tyb, tym = trend * y[idx2], trend * y[idx2 + 1], trend * ym
+        splittable = (xm > xa) & (xm < xb) & (tym > tya) & (tym < tyb)
+        xm, ym = xm.reshape(2, -1), ym.reshape(2, -1)
+        good = (good & splittable).reshape(2, -1).all(axis=0)
+        splittable = splittable.reshape(2, -1).all(axis=0)
+        splittable &= (xm[0] < xm[1]) & (trend * ym[0] < trend * ym[1])
+        verified[idx[good]] = True
+        pending[idx] = False
+
+        split = ~good & splittable
+        if not split.any() or y.size + 2 * split.sum() > max_nodes:
+            break
+
+        # Inserting the new points and flagging the intervals whose
+        # interpolant changes as pending
+        at = np.repeat(idx[split] + 1, 2)
+        x = np.insert(x, at, xm[:, split].T.ravel())
+        y = np.insert(y, at, ym[:, split].T.ravel())
+        verified = np.insert(verified, at, False)
+        pending = np.insert(pending, at, False)
+        newpos = at + np.arange(at.size)
+        for shift in (-2, -1, 0, 1):
+            pos = np.clip(newpos + shift, 0, pending.size - 1)
+            pending[pos] = True
+        verified[pending] = False
+
+    order = slice(None) if trend == 1 else slice(None, None, -1)
+    dxdy = _pchip_slopes(y[order], x[order])
+    return _InverseTable(y[order].copy(), x[order].copy(), dxdy,
+                         verified[order].copy())
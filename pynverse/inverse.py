@@ -1,9 +1,45 @@
+import os
+import pickle
+import threading
 import numpy as np
 import warnings
+import weakref
+from collections import namedtuple
+from functools import partial
+from timeit import default_timer
 
-from scipy.optimize import minimize_scalar
+from ._solvers import _expand_brackets, _illinois, _newton
+from ._tables import _build_table, _domain_transform, _InverseTable
+from ._surface import _build_surface, _InverseSurface
+from ._chebyshev import _build_chebyshev, _ChebyshevInverse
+from ._cache import _LRUCache, _CacheInfo
+from ._streaming import _chunk_bounds, _iter_chunks, _map_file
+from ._stats import _Stats
+from ._samples import (_KINDS, _check_samples, _chunked_pchip_slopes,
+                       _SampleFunction, _SampleTable)
+from .utils import Piecewise, _segments
+from ._batch import (_normparams_batch, _batch_refpoints, _batch_end,
+                     _broadcast_batch, _channel_values, _ChannelFunc)
 
-__all__ = ['inversefunc']
+__all__ = ['inversefunc', 'inverse_from_samples', 'InverseFunction']
+
+_METHODS = ('brent', 'vectorized', 'newton', 'halley', 'table', 'chebyshev')
+_EXECUTORS = ('thread', 'process')
+# Number of values solved at a time when writing into `out`
+_OUT_CHUNK_SIZE = 2**16
+# Result of solving for the inverse of an array of values: the inverse, the
+# mask of the converged values, the absolute residual in y (NaN if unknown),
+# and the number of evaluations of the function and iterations per value
+_Solution = namedtuple('_Solution', ['x', 'converged', 'residual', 'nfev',
+                                     'nit'])
+_TABLE_KINDS = {_InverseTable: 'table', _InverseSurface: 'surface',
+                _ChebyshevInverse: 'chebyshev', _SampleTable: 'samples'}
+
+# Everything needed to solve for the inverse, as a picklable object that can
+# be sent to worker processes
+_Problem = namedtuple('_Problem', ['func', 'args', 'domain', 'open_domain',
+                                   'trend', 'refs', 'frefs', 'fends',
+                                   'skeleton', 'derivatives', 'solver'])
 
 
 def inversefunc(func,
@@ -12,7 +48,21 @@ def inversefunc(func,
                 image=None,
                 open_domain=None,
                 args=(),
-                accuracy=2):
+                accuracy=2,
+                method=None,
+                tolerance=None,
+                fprime=None,
+                fprime2=None,
+                workers=None,
+                executor='thread',
+                cache_size=None,
+                verify='full',
+                param_range=None,
+                table_path=None,
+                stats=False,
+                callback=None,
+                batch_shape=None,
+                skeleton=True):
     r"""Obtain the inverse of a function.
 
     Returns the numerical inverse of the function `f`. It may return a callable
@@ -35,6 +85,10 @@ def inversefunc(func,
         inverted along the axis corresponding to the first argument.
         The function must not diverge and have a continuous strictly monotonic
         behavior in the chosen interval.
+        A `Piecewise` function is inverted segment by segment, with the
+        analytic inverse of the segments that have one, routing each of
+        the values to its segment with a single search in the images of
+        the breakpoints.
     y_values : float, ndarray, optional
         Values for which calculate the inverse function. If set to None, then
         a callable that can be used to calculate the inverse of values is
@@ -61,12 +115,162 @@ def inversefunc(func,
         Number of digits for the desired accuracy. It will give a warning
         if the accuracy is worse than this.
         Default 2.
+    method : str, optional
+        Numerical method used to calculate the inverse:
+
+        * 'brent': minimizes the squared residual for each of the values
+          independently using the Brent method from scipy.
+        * 'vectorized': finds brackets for all the values and runs the
+          Illinois root finding method on all of them in lockstep, calling
+          `func` once per iteration with an ndarray containing all the
+          points that have not converged. Much faster for large arrays of
+          values, as long as `func` is vectorized.
+        * 'newton': same as 'vectorized', but using safeguarded Newton
+          iterations with the derivative `fprime`, falling back to
+          bisection whenever a step leaves the bracket of the root.
+        * 'halley': same as 'newton', but using Halley iterations with the
+          second derivative `fprime2`.
+        * 'table': samples `func` once when the inverse is built, refining
+          the sampling adaptively until a monotone cubic interpolation of
+          the inverse meets `tolerance`. Calculating the inverse then only
+          requires a `np.searchsorted` and a polynomial evaluation. Values
+          outside the tabulated part of the image (e.g. close to open or
+          infinite ends of the domain) are calculated with the
+          'vectorized' method.
+        * 'chebyshev': fits a piecewise Chebyshev approximation of the
+          inverse when the inverse is built, by solving at the Chebyshev
+          points of the image interval and bisecting it until the
+          coefficients decay below `tolerance`. It needs far fewer
+          coefficients than 'table' for smooth functions. Values outside
+          the converged pieces are calculated with the 'vectorized'
+          method.
+
+        Default None, which is 'halley' if `fprime` and `fprime2` are
+        given, 'newton' if only `fprime` is given, and 'brent' otherwise,
+        or 'vectorized' if scipy is not installed. scipy is only imported
+        when the 'brent' method is used.
+    tolerance : float, optional
+        Maximum error in the inverse for approximations built in advance,
+        such as `method='table'` or `method='chebyshev'`. It must be
+        positive, and is a relative error for inverse values larger than
+        1 in absolute value. Default None, one order of magnitude below
+        the `accuracy`.
+    fprime : callable, optional
+        Derivative of `func`, taking the same arguments. If given, the
+        vectorized root finding uses Newton steps, including the solves
+        needed by the 'table' and 'chebyshev' methods. Default None.
+    fprime2 : callable, optional
+        Second derivative of `func`, taking the same arguments. If given
+        together with `fprime`, Halley steps are used. Default None.
+    workers : int, optional
+        Number of workers used to solve large arrays of values
+        concurrently, by splitting them in chunks. The pool of workers is
+        created on first use, and shut down by `close`, on exiting a
+        `with` block, or when the inverse is garbage collected. Default
+        None, no parallel execution.
+    executor : str or concurrent.futures.Executor, optional
+        Kind of workers: 'thread' or 'process', or an existing executor to
+        submit the chunks to. Processes require `func`, `args` and the
+        derivatives to be picklable, e.g. functions defined at module
+        level instead of lambdas. Default 'thread'.
+    cache_size : int, optional
+        Maximum number of values whose inverse is kept in a least recently
+        used cache, so repeated values are not solved again. Only exact
+        repeats of the values hit the cache. The returned callable then
+        has `cache_info()` and `cache_clear()` methods, as the functions
+        decorated with `functools.lru_cache`. The cache is thread-safe.
+        It must be a positive integer. Default None, no cache.
+    verify : str, optional
+        How the accuracy of the results is verified against `accuracy`:
+
+        * 'full': all the results are verified. The residuals computed by
+          the root finding methods are used where available, and `func`
+          is only evaluated again for the rest of the results (e.g. the
+          ones interpolated by the 'table' and 'chebyshev' methods, or
+          found in the cache).
+        * 'sample:<n>': same as 'full', but `func` is evaluated again for
+          at most `n` evenly spaced results.
+        * 'none': no verification.
+
+        Default 'full'.
+    param_range : array_like, optional
+        Range (`param_range[0]`, `param_range[1]`) of the first of the
+        `args`, the parameter `p` of the function `func(x, p, *args[1:])`,
+        over which the inverse is tabulated with `method='table'`. Tables
+        are built for a set of values of the parameter, refined until the
+        cubic interpolation in `p` between them is within `tolerance`.
+        Values of the parameter are then given to the callable as per-call
+        `args`. Default None, the inverse is only tabulated for `args`.
+    table_path : str, optional
+        Directory of a table saved with the `save_table` method of the
+        callable from `method='table'`, loaded as memory maps instead of
+        building the table again, so many processes can share a single
+        copy. It must have been built with the same arguments. Default
+        None.
+    stats : bool, optional
+        Whether to collect statistics of the calls to the inverse, returned
+        by its `stats()` method. Default False.
+    callback : callable, optional
+        Called after every call to the inverse with a dict recording the
+        number of 'values', the evaluations of `func` to solve them
+        ('nfev') and to verify them ('nfev_verify'), the iterations of the
+        solvers ('nit'), the number of values that did not converge
+        ('failures') or were verified with less than `accuracy` digits
+        ('inaccurate'), and the wall time in seconds spent checking the
+        values against the image ('time_check'), solving
+        ('time_solve'), verifying ('time_verify') and in total
+        ('time_total'). The same fields are summed by `stats()`.
+        Default None.
+    batch_shape : int or tuple of ints, optional
+        Shape of a batch of independent functions (channels) computed by
+        `func` at once: `func` takes an ndarray with `batch_shape` as its
+        leading dimensions, and returns the values of each of the channels
+        at the points of the same channel, with the same shape. Each of
+        the ends of `domain` and `image` may then be an array broadcastable
+        to `batch_shape`, with the limits of each of the channels, and the
+        trend is calculated for each of them. The values given to the
+        inverse must have `batch_shape` (or dimensions broadcastable to it)
+        as their leading dimensions. All the channels are solved together,
+        in lockstep, calling `func` once per iteration with an array with
+        the shape of all the values. Only the 'vectorized', 'newton' and
+        'halley' methods are supported, with the derivatives following the
+        same convention as `func`, and without `param_range`,
+        `table_path`, `cache_size`, `workers` or per-call `args`. The
+        methods solving flattened chunks of the values (`iter_chunks`,
+        `map_file` and `solve_async`) raise ValueError.
+        Default None, a single function.
+    skeleton : bool, optional
+        Whether to evaluate `func` once, when the inverse is built, at
+        points spaced logarithmically towards the unbounded ends of the
+        domain, keeping the values as a skeleton of the function used to
+        bracket the solves. It is never built for a bounded domain, or
+        with `batch_shape`. Default True.
 
     Returns
     -------
-    callable or ndarray
+    InverseFunction or ndarray
         Inverse function of `func`. It can take scalars or ndarrays, and return
         objects of the same kind with the calculated inverse values.
+        See `InverseFunction.__call__` for the arguments it takes on each
+        call, such as `out`, `full_output`, per-call `args` and limits.
+        It can be pickled, or saved with its `save(path)` method and
+        loaded back with `InverseFunction.load(path)`, memory mapping any
+        table built in advance.
+        For inputs too large for memory, the callable has two additional
+        methods: `iter_chunks(arrays, chunk_size=2**20)`, a generator
+        yielding the inverse of consecutive chunks of at most `chunk_size`
+        values of each of the arrays (flattened), and
+        `map_file(in_path, out_path, chunk_size=2**20)`, which writes the
+        inverse of the values in a `.npy` file into a new `.npy` file,
+        accessing both as memory maps one chunk at a time.
+        In asyncio applications, the coroutine
+        `solve_async(y_values, executor=None, chunk_size=2**16,
+        timeout=None)` calculates the inverse in chunks in an executor,
+        without blocking the event loop, combining the chunks of
+        concurrent requests into shared batches.
+        With `method='table'`, the callable has a `save_table(path)`
+        method that saves the table as `.npy` files in the directory
+        `path`, to be loaded later with `table_path`.
 
     Notes
     -----
@@ -98,109 +302,1453 @@ def inversefunc(func,
 
     """
 
-    domain, image, open_domain, args = _normparams_inversefunc(domain,
-                                                               image,
-                                                               open_domain,
-                                                               args)
+    inv = InverseFunction(func, domain=domain, image=image,
+                          open_domain=open_domain, args=args,
+                          accuracy=accuracy, method=method,
+                          tolerance=tolerance, fprime=fprime,
+                          fprime2=fprime2, workers=workers, executor=executor,
+                          cache_size=cache_size, verify=verify,
+                          param_range=param_range, table_path=table_path,
+                          stats=stats, callback=callback,
+                          batch_shape=batch_shape, skeleton=skeleton)
 
-    ymin, ymax = image
-    xmin, xmax = domain
-    xmin_open, xmax_open = open_domain
+    if y_values is None:
+        return inv
+    else:
+        return inv(y_values)
 
-    # Calculating if the function is increasing or decreasing, using ref points
-    # anywhere in the valid range (Function has to be strictly monotonic)
-    ref1, ref2 = _get_valid_refpoints(xmin, xmax)
-    trend = np.sign(func(ref2, *args) - func(ref1, *args))
 
-    if trend == 0:
-        raise ValueError("Function is not strictly monotonic")
+def inverse_from_samples(x, y, y_values=None, kind='linear', trend=None,
+                         accuracy=2, cache_size=None, verify='none',
+                         stats=False, callback=None, chunk_size=2**20):
+    r"""Obtain the inverse of a monotonic function from its samples.
 
-    # Calculating the image by default
-    if ymin is None:
-        ymin = _auto_ymin(func, args, xmin, xmax, trend)
-    if ymax is None:
-        ymax = _auto_ymax(func, args, xmin, xmax, trend)
+    The inverse is interpolated directly from the samples, finding the
+    interval of each of the values with a binary search, without solving
+    for the roots of an interpolant of the function.
 
-    # Creating bounded function
-    def bounded_f(x):
-        if xmin is not None and (x < xmin or (x == xmin and xmin_open)):
-                val = -1 * np.inf * trend
-        elif xmax is not None and (x > xmax or (x == xmax and xmax_open)):
-                val = np.inf * trend
+    Parameters
+    ----------
+    x : ndarray or str
+        Strictly increasing points where the function was sampled, or the
+        path of a `.npy` file with them, which is loaded as a memory map.
+    y : ndarray or str
+        Values of the function at the points `x`, strictly monotonic, or
+        the path of a `.npy` file with them.
+    y_values : float, ndarray, optional
+        Values for which calculate the inverse function. If set to None, then
+        a callable that can be used to calculate the inverse of values is
+        returned. Default None.
+    kind : str, optional
+        Interpolation of the inverse between the samples: 'linear', or
+        'pchip' for a monotone piecewise cubic Hermite interpolant.
+        Default 'linear'.
+    trend : int, optional
+        1 if the function is increasing, -1 if decreasing. The samples are
+        checked to be strictly monotonic in that direction.
+        Default None, the direction of the samples.
+    accuracy, cache_size, verify, stats, callback : optional
+        Same as for `inversefunc`, with `func` the linear interpolation of
+        the samples. Default `verify` is 'none', as the inverse
+        interpolates the samples.
+    chunk_size : int, optional
+        Maximum number of samples read at a time to check them and to
+        calculate the derivatives of the 'pchip' interpolant, so memory
+        maps larger than the available memory can be used.
+        Default 2**20.
+
+    Returns
+    -------
+    InverseFunction or ndarray
+        Inverse function of the samples, as returned by `inversefunc`, with
+        the image of the samples. The samples are not copied, so memory
+        maps are only read around the values.
+
+    Examples
+    --------
+    >>> from pynverse import inverse_from_samples
+    >>> import numpy as np
+    >>> x = np.linspace(0, 2, 201)
+    >>> inverse_from_samples(x, x**2, y_values=[1., 2.25])
+    array([ 1. ,  1.5])
+
+    """
+    tstart = default_timer()
+    if kind not in _KINDS:
+        raise ValueError("kind must be one of %s" % str(_KINDS))
+    x, y = [np.load(a, mmap_mode='r') if isinstance(a, str)
+            else np.asanyarray(a) for a in (x, y)]
+    trend = _check_samples(x, y, trend, chunk_size)
+    dxdy = None
+    if kind == 'pchip':
+        dxdy = _chunked_pchip_slopes(y, x, chunk_size)
+    table = _SampleTable(y, x, trend, dxdy)
+    # Interpolated from the table, with the solvers for the linear
+    # interpolation of the samples only as a fallback
+    inv = InverseFunction(_SampleFunction(table),
+                          domain=[float(x[0]), float(x[-1])],
+                          accuracy=accuracy, method='vectorized',
+                          cache_size=cache_size, verify=verify, stats=stats,
+                          callback=callback)
+    inv.table = table
+    if inv._stats is not None:
+        inv._stats.time_setup = default_timer() - tstart
+
+    if y_values is None:
+        return inv
+    else:
+        return inv(y_values)
+
+
+class InverseFunction(object):
+    r"""Numerical inverse of a function.
+
+    Callable object returned by `inversefunc`, built with the same
+    arguments except `y_values`, and called with the values to invert
+    (see `__call__`). It holds the normalized domain and image of the
+    function, its trend, the `skeleton` of values of the function at
+    points spaced logarithmically towards the unbounded ends of the
+    domain, used to bracket the solves, and any table or approximation
+    built in advance, so it can be pickled, or saved with `save` and
+    loaded back with `load` without probing the function or building the
+    tables again.
+
+    """
+
+    def __init__(self, func, domain=None, image=None, open_domain=None,
+                 args=(), accuracy=2, method=None, tolerance=None,
+                 fprime=None, fprime2=None, workers=None, executor='thread',
+                 cache_size=None, verify='full', param_range=None,
+                 table_path=None, stats=False, callback=None,
+                 batch_shape=None, skeleton=True):
+        tstart = default_timer()
+        if batch_shape is None:
+            domain, image, open_domain, args = _normparams_inversefunc(
+                domain, image, open_domain, args)
+        else:
+            batch_shape = tuple(int(n) for n in np.atleast_1d(batch_shape))
+            _, _, open_domain, args = _normparams_inversefunc(
+                None, None, open_domain, args)
+            domain, image = _normparams_batch(domain, image, batch_shape)
+
+        if method is None:
+            if param_range is not None or table_path is not None:
+                method = 'table'
+            elif fprime is not None:
+                method = 'newton' if fprime2 is None else 'halley'
+            elif _scipy_available() and batch_shape is None:
+                method = 'brent'
+            else:
+                method = 'vectorized'
+        if method not in _METHODS:
+            raise ValueError("method must be one of %s" % str(_METHODS))
+        if method == 'brent' and not _scipy_available():
+            raise ImportError("method brent requires scipy")
+        if method in ('newton', 'halley') and fprime is None:
+            raise ValueError("method %s requires fprime" % method)
+        if method == 'halley' and fprime2 is None:
+            raise ValueError("method halley requires fprime2")
+        if method != 'table' and (param_range is not None or
+                                  table_path is not None):
+            raise ValueError("param_range and table_path require method "
+                             "table")
+        if isinstance(func, Piecewise) and (param_range is not None or
+                                            table_path is not None):
+            raise ValueError("param_range and table_path are not supported "
+                             "for Piecewise functions")
+        if batch_shape is not None:
+            if method not in ('vectorized', 'newton', 'halley'):
+                raise ValueError("batch_shape requires method vectorized, "
+                                 "newton or halley")
+            if (param_range is not None or table_path is not None or
+                    cache_size or (workers is not None and workers > 1) or
+                    isinstance(func, Piecewise)):
+                raise ValueError("param_range, table_path, cache_size, "
+                                 "workers and Piecewise functions are not "
+                                 "supported with batch_shape")
+        if cache_size is not None and (
+                isinstance(cache_size, bool) or
+                not isinstance(cache_size, (int, np.integer)) or
+                cache_size < 1):
+            raise ValueError("cache_size must be a positive integer")
+        if tolerance is not None and not tolerance > 0:
+            raise ValueError("tolerance must be positive")
+        if param_range is not None and len(args) == 0:
+            raise ValueError("param_range requires the parameter as the "
+                             "first of args")
+        if method != 'halley':
+            fprime2 = None
+        if not (executor in _EXECUTORS or hasattr(executor, 'submit')):
+            raise ValueError("executor must be one of %s or an Executor" %
+                             str(_EXECUTORS))
+
+        ymin, ymax = image
+        xmin, xmax = domain
+        self.skeleton_enabled = skeleton
+
+        if batch_shape is None:
+            # Calculating if the function is increasing or decreasing, using
+            # ref points anywhere in the valid range (Function has to be
+            # strictly monotonic)
+            ref1, ref2 = _get_valid_refpoints(xmin, xmax)
+            fref1, fref2 = func(ref1, *args), func(ref2, *args)
+            trend = np.sign(fref2 - fref1)
+
+            if trend == 0:
+                raise ValueError("Function is not strictly monotonic")
+
+            # Calculating the image by default
+            if ymin is None:
+                ymin = _auto_ymin(func, args, xmin, xmax, trend)
+            if ymax is None:
+                ymax = _auto_ymax(func, args, xmin, xmax, trend)
+            fends = _end_images(func, args, domain, open_domain, trend)
+            skeleton = (_build_skeleton(func, args, domain, open_domain,
+                                        trend) if skeleton else None)
+        else:
+            # The same for each of the channels, evaluating all of them at
+            # once
+            ref1, ref2 = _batch_refpoints(xmin, xmax)
+            fref1, fref2 = [np.broadcast_to(func(ref, *args),
+                                            batch_shape).astype(np.float64)
+                            for ref in (ref1, ref2)]
+            trend = np.sign(fref2 - fref1)
+
+            if not (np.abs(trend) == 1).all():
+                raise ValueError("Function is not strictly monotonic for "
+                                 "the channels %s" % str(
+                                     np.argwhere(np.abs(trend) != 1)
+                                     .tolist()))
+
+            flo = _batch_end(func, args, xmin, ref1, -trend, batch_shape)
+            fhi = _batch_end(func, args, xmax, ref2, trend, batch_shape)
+            if ymin is None:
+                ymin = np.minimum(flo, fhi)
+            if ymax is None:
+                ymax = np.maximum(flo, fhi)
+            fends = skeleton = None
+
+        if tolerance is None:
+            tolerance = 10. ** -(accuracy + 1)
+
+        self.func = func
+        self.args = args
+        self.domain = domain
+        self.open_domain = open_domain
+        self.image = image
+        self.ymin = ymin
+        self.ymax = ymax
+        self.trend = trend
+        self.refs = (ref1, ref2)
+        self.frefs = (fref1, fref2)
+        self.fends = fends
+        self.skeleton = skeleton
+        self.batch_shape = batch_shape
+        self.accuracy = accuracy
+        self.method = method
+        self.tolerance = tolerance
+        self.derivatives = (fprime, fprime2)
+        self.workers = workers
+        self.executor = executor
+        self.cache_size = cache_size
+        self.verify = verify
+        self._nsample = _parse_verify(verify)
+        self.stats_enabled = stats
+        self.callback = callback
+        self.pieces = self.ybreaks = None
+        self._setup()
+
+        if isinstance(func, Piecewise):
+            self._build_pieces()
+        elif table_path is not None:
+            if os.path.exists(os.path.join(table_path, 'p.npy')):
+                self.surface = _InverseSurface.load(table_path,
+                                                    mmap_mode='r')
+            else:
+                self.table = _InverseTable.load(table_path, mmap_mode='r')
+        elif param_range is not None:
+            self.surface = _build_surface(
+                lambda x, p: func(x, p, *args[1:]), domain, open_domain,
+                self.refs, tolerance, param_range,
+                ytolerance=10. ** -accuracy)
+        elif method == 'table':
+            # Verified in y too, as the accuracy of the results is checked
+            # with the residual of the function
+            self.table = _build_table(lambda x: func(x, *args), domain,
+                                      open_domain, trend, tolerance,
+                                      ytolerance=10. ** -accuracy)
+        elif method == 'chebyshev':
+            ylo, yhi = _finite_image(func, args, domain, open_domain, trend,
+                                     ymin, ymax)
+            rtol = min(1.48e-08, tolerance / 100.)
+            self.table = _build_chebyshev(
+                lambda yv: self._solve(yv, xtol=rtol / 100., rtol=rtol)[:2],
+                ylo, yhi, tolerance,
+                f=lambda x: _bounded_func(func, args, x, domain, open_domain,
+                                          trend),
+                ytolerance=10. ** -accuracy)
+        if self._stats is not None:
+            self._stats.time_setup = default_timer() - tstart
+
+    def _build_pieces(self):
+        # Inverse of each of the segments of a Piecewise function inside the
+        # domain, and the images of the breakpoints between them
+        func, args = self.func, self.args
+        xmin, xmax = self.domain
+        xmin_open, xmax_open = self.open_domain
+        lows = np.concatenate([[-np.inf], func.breakpoints])
+        highs = np.concatenate([func.breakpoints, [np.inf]])
+        pieces = []
+        breaks = []
+        for i in range(len(func.funclist)):
+            lo = lows[i] if xmin is None else max(lows[i], xmin)
+            hi = highs[i] if xmax is None else min(highs[i], xmax)
+            if not lo < hi:
+                continue
+            if pieces:
+                breaks.append(lo)
+            if func.inverses[i] is not None:
+                pieces.append(func.inverses[i])
+                continue
+            piece = InverseFunction(
+                func.funclist[i],
+                domain=[None if np.isinf(lo) else lo,
+                        None if np.isinf(hi) else hi],
+                open_domain=[lo == xmin and xmin_open,
+                             hi == xmax and xmax_open],
+                args=args, accuracy=self.accuracy, method=self.method,
+                tolerance=self.tolerance, fprime=self.derivatives[0],
+                fprime2=self.derivatives[1], verify='none',
+                skeleton=self.skeleton_enabled)
+            if piece.trend != self.trend:
+                raise ValueError("Function is not strictly monotonic")
+            pieces.append(piece)
+        self.pieces = pieces
+        self.ybreaks = np.asarray(func(np.array(breaks), *args),
+                                  dtype=np.float64).reshape(-1)
+
+    def _calculate_pieces(self, yv, ydir, limits):
+        # Routes each of the values to the segment of the Piecewise function
+        # whose image contains it, with a single search in the images of
+        # the breakpoints
+        trend = self.trend
+        index = np.searchsorted(trend * self.ybreaks, trend * yv,
+                                side='right')
+        solution = _new_solution(np.full(yv.shape, np.nan),
+                                 np.zeros(yv.shape, dtype=bool))
+        for i, idx in _segments(index, len(self.pieces)):
+            piece = self.pieces[i]
+            if isinstance(piece, InverseFunction):
+                part = piece._calculate(yv[idx], ydir, limits)
+            else:
+                with np.errstate(all='ignore'):
+                    x = np.asarray(piece(yv[idx], *self.args),
+                                   dtype=np.float64)
+                part = _new_solution(x, np.isfinite(x))
+            _fill_solution(solution, idx, part)
+        return solution
+
+    def _setup(self):
+        # State that is not saved: the problem sent to the solvers, the
+        # cache and the pool of workers
+        if self.method in ('table', 'chebyshev'):
+            solver = 'vectorized' if self.derivatives[0] is None else 'newton'
         else:
-            val = func(x, *args)
-        return val
+            solver = self.method
+        self._problem = _Problem(self.func, self.args, self.domain,
+                                 self.open_domain, self.trend, self.refs,
+                                 self.frefs, self.fends, self.skeleton,
+                                 self.derivatives,
+                                 solver)
+        self._cache = (_LRUCache(self.cache_size) if self.cache_size
+                       else None)
+        self._stats = _Stats() if self.stats_enabled else None
+        self._pool = None
+        self._pool_finalizer = None
+        self._pool_lock = threading.Lock()
+        self._batchers = {}
+        self.table = None
+        self.surface = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_problem', '_cache', '_stats', '_pool',
+                     '_pool_finalizer', '_pool_lock', '_batchers'):
+            del state[name]
+        if not isinstance(self.executor, str):
+            state['executor'] = 'thread'
+        return state
+
+    def __setstate__(self, state):
+        table, surface = state.pop('table'), state.pop('surface')
+        state.setdefault('skeleton', None)
+        state.setdefault('skeleton_enabled', True)
+        state.setdefault('batch_shape', None)
+        state.setdefault('pieces', None)
+        state.setdefault('ybreaks', None)
+        self.__dict__.update(state)
+        self._setup()
+        self.table, self.surface = table, surface
+        if isinstance(self.func, _SampleFunction):
+            self.func.table = table
+
+    def _solve(self, yv, ydir=0, xtol=1e-11, rtol=1.48e-08, max_fev=None,
+               deadline=None):
+        workers = self.workers
+        if workers is not None and workers > 1 and yv.size >= 2 * workers:
+            return _solve_parallel(self._problem, yv, ydir, xtol, rtol,
+                                   max_fev, deadline, self._get_pool(),
+                                   workers)
+        return _solve(self._problem, yv, ydir, xtol, rtol, max_fev, deadline)
+
+    def _get_pool(self):
+        # Created once, even when several threads make their first call at
+        # the same time
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = _make_executor(self.executor, self.workers)
+                if isinstance(self.executor, str):
+                    # Only the pools created here are shut down
+                    self._pool_finalizer = weakref.finalize(
+                        self, self._pool.shutdown, wait=False)
+            return self._pool
+
+    def _calculate(self, yv, ydir, limits):
+        if self.pieces is not None:
+            return self._calculate_pieces(yv, ydir, limits)
+        if self.table is not None:
+            solution = _new_solution(*self.table(yv))
+            # Approximations falling out of the domain are solved instead
+            solution.converged[...] &= _inside_domain(
+                solution.x, self.domain, self.open_domain)
+            missing = ~solution.converged
+            if missing.any():
+                _fill_solution(solution, missing,
+                               self._solve(yv[missing], ydir, **limits))
+            return solution
+        return self._solve(yv, ydir, **limits)
 
-    min_kwargs = {}
-    min_kwargs['bracket'] = (ref1, ref2)
-    min_kwargs['tol'] = 1.48e-08
-    min_kwargs['method'] = 'Brent'
+    def _lookup_or_calculate(self, yv, ydir, limits):
+        # Values solved with their own limits are neither looked up nor
+        # cached, as they may be less accurate than the cached ones
+        cache = self._cache
+        if cache is None or limits:
+            return self._calculate(yv, ydir, limits)
+        solution = _new_solution(*cache.lookup(yv))
+        missing = ~solution.converged
+        if missing.any():
+            _fill_solution(solution, missing,
+                           self._calculate(yv[missing], ydir, limits))
+            solved = missing & solution.converged
+            cache.store(yv[solved], solution.x[solved])
+        return solution
 
-    def inv(yin):
+    def _calculate_family(self, yv, familyargs, usesurface, limits):
+        if not usesurface:
+            return _solve_family(self._problem, yv, familyargs, self.image,
+                                 **limits)
+        solution = _new_solution(*self.surface(yv, familyargs[0]))
+        missing = ~solution.converged
+        if missing.any():
+            _fill_solution(solution, missing, _solve_family(
+                self._problem, yv[missing],
+                tuple(a[missing] for a in familyargs), self.image,
+                **limits))
+        return solution
+
+    def __call__(self, yin, presorted=None, out=None, dtype=None,
+                 full_output=False, args=None, xtol=None, rtol=None,
+                 max_fev=None, deadline=None):
+        r"""Calculate the inverse of the values.
+
+        Parameters
+        ----------
+        yin : float, ndarray
+            Values for which calculate the inverse function. With
+            `batch_shape`, their leading dimensions select the channel.
+        presorted : bool, optional
+            When the values are sorted, the solves are warm started from
+            the solutions of their neighbours. True skips the check of the
+            order, and False disables the warm starts. Default None, the
+            order is detected automatically.
+        out : ndarray, optional
+            Existing array, with the same shape as the values, where the
+            inverse values are written and returned. Large arrays written
+            into `out` without `full_output` or per-call `args` are solved
+            in chunks of 2**16 values, so the memory used by the solvers
+            does not grow with the number of values. Each chunk is then
+            reported as a separate call to `callback` and in `stats`.
+            Default None.
+        dtype : dtype, optional
+            Floating point type of the returned values, such as
+            np.float32. It must match the dtype of `out` if given. The
+            solves are always done in float64. Default None, float64.
+        full_output : bool, optional
+            Whether to also return a dict with information about each of
+            the values. Default False.
+        args : tuple or ndarray, optional
+            Per-call args, a tuple of arrays (or a single array) broadcast
+            against the values, to invert a whole parametric family of
+            functions with a single vectorized solve. Trailing args that
+            are not given are taken from the `args` of the inverse. The
+            trend and the image of the function are then calculated for
+            the args of each value, and the inverse is always calculated
+            as with the 'vectorized' method ('newton' or 'halley' if the
+            derivatives are given), without cache or warm starts.
+            Default None.
+        xtol, rtol : float, optional
+            Absolute and relative tolerances of the solvers in x. Default
+            None, 1e-11 and 1.48e-08. 'brent' only uses `rtol`.
+        max_fev : int, optional
+            Maximum number of evaluations of `func` for each value.
+            Default None, no limit.
+        deadline : float, optional
+            Maximum time in seconds spent in the call. Default None, no
+            limit.
+
+        Returns
+        -------
+        ndarray or tuple
+            Inverse values, with the shape of the values. The values
+            stopped by `max_fev` or `deadline` get the best estimate found
+            so far (NaN if no bracket was found), and are only reported as
+            not converged in `full_output`, without warnings. Values
+            solved with their own limits skip the cache.
+            With `full_output=True`, a tuple with the inverse values and a
+            dict with the boolean masks 'converged' (the solve succeeded),
+            'verified' (the accuracy was verified) and 'failed' (not
+            converged, or verified with less than `accuracy` digits), the
+            absolute 'residual' in y of the verified values (NaN for the
+            rest), and the evaluations of `func` 'nfev' and iterations
+            'nit' used to solve each of the values, all with the shape of
+            the values.
+
+        """
+        tstart = default_timer()
+        limits = _parse_limits(xtol, rtol, max_fev, deadline, tstart)
+        if (out is not None and not full_output and args is None and
+                self.batch_shape is None and self.surface is None and
+                np.size(yin) > _OUT_CHUNK_SIZE):
+            return self._call_chunks(yin, presorted, out, dtype, limits)
+        return self._evaluate(yin, presorted, out, dtype, full_output, args,
+                              limits, tstart)
+
+    def _call_chunks(self, yin, presorted, out, dtype, limits):
+        # Solves the values in chunks written into `out`, so the work
+        # arrays of the solvers do not grow with the number of values
+        yin = np.asanyarray(yin)
+        _check_out(out, yin.shape, dtype)
+        outflat = out.reshape(-1) if out.flags.c_contiguous else None
+        for start, end in _chunk_bounds(yin.size, _OUT_CHUNK_SIZE):
+            ychunk = yin.flat[start:end]
+            if outflat is not None:
+                self._evaluate(ychunk, presorted, outflat[start:end], None,
+                               False, None, limits, default_timer())
+            else:
+                out.flat[start:end] = self._evaluate(
+                    ychunk, presorted, None, None, False, None, limits,
+                    default_timer())
+        return out
+
+    def _evaluate(self, yin, presorted, out, dtype, full_output, args,
+                  limits, tstart):
         yin = np.asarray(yin, dtype=np.float64)
+        fixedargs = self.args
+        familyargs = None
+        batch_shape = self.batch_shape
+        if batch_shape is not None:
+            if args is not None:
+                raise ValueError("Per-call args are not supported with "
+                                 "batch_shape")
+            yin = _broadcast_batch(yin, batch_shape)
+        if args is None and self.surface is not None:
+            args = fixedargs[:1]
+        if args is not None:
+            # Parameters of each of the values, broadcast against them,
+            # with the trailing ones not given taken from fixedargs
+            if not isinstance(args, tuple):
+                args = (args,)
+            usesurface = self.surface is not None and len(args) == 1
+            args = args + fixedargs[len(args):]
+            arrays = np.broadcast_arrays(yin, *[np.asarray(a) for a in args])
+            yin = arrays[0]
+            familyargs = tuple(a.reshape(-1) for a in arrays[1:])
         shapein = yin.shape
-        yin = yin.flatten()
-        if ymin is not None:
-            if (xmin_open and trend == 1) or (xmax_open and trend == -1):
-                mask = yin <= ymin
+        # Only copies if the values are not contiguous in memory
+        yin = yin.reshape(-1)
+        if out is not None:
+            _check_out(out, shapein, dtype)
+
+        tcheck = default_timer()
+        if familyargs is not None:
+            solution = self._calculate_family(yin, familyargs, usesurface,
+                                              limits)
+        elif batch_shape is not None:
+            xmin_open, xmax_open = self.open_domain
+            increasing = _channel_values(self.trend, shapein,
+                                         batch_shape) == 1
+            _check_image(yin, _channel_values(self.ymin, shapein, batch_shape),
+                         _channel_values(self.ymax, shapein, batch_shape),
+                         np.where(increasing, xmin_open, xmax_open),
+                         np.where(increasing, xmax_open, xmin_open))
+            tcheck = default_timer()
+            solution = _solve_batch(self._problem, yin, shapein, batch_shape,
+                                    **limits)
+        else:
+            xmin_open, xmax_open = self.open_domain
+            trend = self.trend
+            min_open = ((xmin_open and trend == 1) or
+                        (xmax_open and trend == -1))
+            max_open = ((xmax_open and trend == 1) or
+                        (xmin_open and trend == -1))
+            _check_image(yin, self.ymin, self.ymax, min_open, max_open)
+            tcheck = default_timer()
+            # Sorted values allow warm starting each solve from the
+            # solutions of its neighbours
+            if presorted is None:
+                ydir = _sort_direction(yin)
+            elif presorted:
+                ydir = 1 if yin.size < 2 or yin[0] <= yin[-1] else -1
             else:
-                mask = yin < ymin
-            if yin[mask].size > 0:
+                ydir = 0
+            solution = self._lookup_or_calculate(yin, ydir, limits)
+        results, resultsmask, residual = solution[:3]
+        tsolve = default_timer()
+
+        # Values stopped by the limits of the call are only reported in the
+        # converged mask of full_output
+        limited = 'max_fev' in limits or 'deadline' in limits
+        if not limited and any(~resultsmask):
+            warnings.warn("Trouble calculating inverse for values: "
+                          "%s" % str(yin[~resultsmask]), RuntimeWarning)
+
+        nsample = self._nsample
+        accuracy = self.accuracy
+        nfev_verify = 0
+        if nsample == 0:
+            residual[...] = np.nan
+        elif batch_shape is not None:
+            nfev_verify = _verify_batch(self._problem, yin, shapein,
+                                        batch_shape, results, resultsmask,
+                                        residual)
+        else:
+            nfev_verify = _verify_residual(
+                self.func, fixedargs if familyargs is None else familyargs,
+                yin, results, resultsmask, residual, nsample,
+                familyargs is not None)
+        verified = ~np.isnan(residual)
+        # Same criterion as np.testing.assert_array_almost_equal
+        with np.errstate(invalid='ignore'):
+            failed = ~resultsmask | (residual >= 1.5 * 10. ** -accuracy)
+        inaccurate = failed & verified
+        if limited:
+            inaccurate &= resultsmask
+        else:
+            inaccurate |= ~resultsmask
+        if nsample != 0 and inaccurate.any():
+            warnings.warn("Results obtained with less than %g "
+                          "decimal digits of accuracy"
+                          % accuracy, RuntimeWarning)
+        tverify = default_timer()
+
+        if self._stats is not None or self.callback is not None:
+            record = {'values': yin.size,
+                      'nfev': int(solution.nfev.sum()),
+                      'nfev_verify': nfev_verify,
+                      'nit': int(solution.nit.sum()),
+                      'failures': int((~resultsmask).sum()),
+                      'inaccurate': int((failed & verified).sum()),
+                      'time_check': tcheck - tstart,
+                      'time_solve': tsolve - tcheck,
+                      'time_verify': tverify - tsolve,
+                      'time_total': default_timer() - tstart}
+            if self._stats is not None:
+                self._stats.record(record)
+            if self.callback is not None:
+                self.callback(record)
+
+        if out is not None:
+            out[...] = results.reshape(shapein)
+            xout = out
+        elif dtype is not None and np.dtype(dtype) != results.dtype:
+            xout = results.reshape(shapein).astype(dtype)
+        else:
+            xout = results.reshape(shapein)
+        if full_output:
+            info = {'converged': resultsmask.reshape(shapein),
+                    'verified': verified.reshape(shapein),
+                    'failed': failed.reshape(shapein),
+                    'residual': residual.reshape(shapein),
+                    'nfev': solution.nfev.reshape(shapein),
+                    'nit': solution.nit.reshape(shapein)}
+            return xout, info
+        return xout
+
+    def close(self):
+        """Shuts down the pool of workers created for `workers`, if any.
+        The inverse can still be used, creating a new pool when needed."""
+        with self._pool_lock:
+            if self._pool_finalizer is not None:
+                self._pool_finalizer.detach()
+                self._pool.shutdown()
+            self._pool = self._pool_finalizer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _check_flat_chunks(self, name):
+        # Chunks of the flattened values would be read as values of the
+        # leading channels of a batch
+        if self.batch_shape is not None:
+            raise ValueError("%s is not supported with batch_shape" % name)
+
+    def iter_chunks(self, arrays, chunk_size=2**20):
+        """Yields the inverse of consecutive chunks of at most `chunk_size`
+        values of each of the arrays (flattened)."""
+        self._check_flat_chunks('iter_chunks')
+        return _iter_chunks(self, arrays, chunk_size)
+
+    def map_file(self, in_path, out_path, chunk_size=2**20):
+        """Writes the inverse of the values in the `.npy` file `in_path`
+        into a new `.npy` file `out_path`, accessing both as memory maps
+        one chunk of at most `chunk_size` values at a time."""
+        self._check_flat_chunks('map_file')
+        _map_file(self, in_path, out_path, chunk_size)
+
+    def solve_async(self, y_values, executor=None, chunk_size=2**16,
+                    timeout=None):
+        """Coroutine calculating the inverse of the values without blocking
+        the event loop.
+
+        The values are solved in chunks of at most `chunk_size` values in
+        the `executor` (the default executor of the loop if None), and the
+        chunks of concurrent requests to the same inverse are combined into
+        shared batches. The request can be cancelled, or given a `timeout`
+        in seconds, dropping the chunks not solved yet.
+
+        """
+        self._check_flat_chunks('solve_async')
+        # Imported here, as asyncio is only needed by this method
+        from ._async import _solve_async
+        return _solve_async(self, y_values, executor, chunk_size, timeout)
+
+    def save_table(self, path):
+        """Saves the table of `method='table'` as `.npy` files in the
+        directory `path`, to be loaded with `table_path`."""
+        if self.method != 'table':
+            raise ValueError("Only method table has a table to save")
+        (self.surface if self.table is None else self.table).save(path)
+
+    def cache_info(self):
+        """Statistics of the cache, as `functools.lru_cache`."""
+        if self._cache is None:
+            return _CacheInfo(0, 0, 0, 0, 0)
+        return self._cache.info()
+
+    def cache_clear(self):
+        if self._cache is not None:
+            self._cache.clear()
+
+    def stats(self):
+        """Totals of the records of all the calls since the inverse was
+        built or `stats_clear` was called, as a dict with the number of
+        `calls` and the time spent building the inverse, `time_setup`."""
+        if self._stats is None:
+            raise ValueError("Statistics are only collected with stats=True")
+        return self._stats.totals()
+
+    def stats_clear(self):
+        if self._stats is not None:
+            self._stats.clear()
+
+    def save(self, path):
+        """Saves the inverse in the directory `path`.
+
+        The settings, limits and trend are pickled to `inverse.pickle`,
+        together with `func` and its derivatives when they can be pickled
+        (e.g. functions defined at module level, or numpy ufuncs). Any
+        table or approximation is saved as `.npy` files in the `table`
+        subdirectory, so it can be loaded as memory maps.
+
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        state = self.__getstate__()
+        table = state.pop('table')
+        surface = state.pop('surface')
+        for name in ('func', 'derivatives', 'callback', 'pieces'):
+            try:
+                pickle.dumps(state[name])
+            except Exception:
+                state[name] = None
+        state['table'] = None
+        for saved in (table, surface):
+            if saved is not None:
+                state['table'] = _TABLE_KINDS[type(saved)]
+                saved.save(os.path.join(path, 'table'))
+        with open(os.path.join(path, 'inverse.pickle'), 'wb') as f:
+            pickle.dump(state, f, protocol=2)
+
+    @classmethod
+    def load(cls, path, func=None, fprime=None, fprime2=None,
+             mmap_mode='r'):
+        """Loads an inverse saved with `save`.
+
+        The tables are loaded with the given `mmap_mode` (see `np.load`),
+        so by default processes loading the same inverse share a single
+        copy of them in memory. `func` and its derivatives are required
+        if they could not be pickled when saving, and replace the saved
+        ones otherwise.
+
+        """
+        with open(os.path.join(path, 'inverse.pickle'), 'rb') as f:
+            state = pickle.load(f)
+        if func is not None:
+            state['func'] = func
+        if fprime is not None or fprime2 is not None:
+            state['derivatives'] = (fprime, fprime2)
+        if state['func'] is None:
+            raise ValueError("func could not be saved, it must be given to "
+                             "load the inverse")
+        if state['derivatives'] is None:
+            if state['method'] in ('newton', 'halley'):
+                raise ValueError("fprime could not be saved, it must be "
+                                 "given to load the inverse")
+            state['derivatives'] = (None, None)
+        kind = state.pop('table')
+        state['table'] = state['surface'] = None
+        for table_cls, name in _TABLE_KINDS.items():
+            if name == kind:
+                loaded = table_cls.load(os.path.join(path, 'table'),
+                                        mmap_mode=mmap_mode)
+                state['surface' if kind == 'surface' else 'table'] = loaded
+        inv = cls.__new__(cls)
+        inv.__setstate__(state)
+        if isinstance(inv.func, Piecewise) and inv.pieces is None:
+            # The inverses of the segments could not be saved
+            inv._build_pieces()
+        return inv
+
+
+def _solve(problem, yin, ydir=0, xtol=1e-11, rtol=1.48e-08, max_fev=None,
+           deadline=None):
+    # Solves for the inverse of the values with the solver of the problem
+    if problem.solver == 'brent':
+        min_kwargs = {}
+        min_kwargs['bracket'] = problem.refs
+        # Brent only has a relative tolerance, with a fixed absolute floor
+        min_kwargs['tol'] = rtol
+        min_kwargs['method'] = 'Brent'
+        return _solve_brent(partial(_bounded_problem, problem), yin,
+                            problem.fends, min_kwargs, ydir, problem.trend,
+                            max_fev, deadline, problem.skeleton)
+    return _solve_vectorized(problem.func, problem.args, yin, problem.domain,
+                             problem.open_domain, problem.trend, problem.refs,
+                             problem.frefs, xtol, rtol, problem.derivatives,
+                             ydir, max_fev=max_fev, deadline=deadline,
+                             skeleton=problem.skeleton)
+
+
+def _solve_parallel(problem, yin, ydir, xtol, rtol, max_fev, deadline,
+                    executor, workers):
+    # Splits the values in one chunk per worker, solved concurrently
+    bounds = np.linspace(0, yin.size, workers + 1).astype(int)
+    futures = [executor.submit(_solve, problem, yin[start:end], ydir, xtol,
+                               rtol, max_fev, deadline)
+               for start, end in zip(bounds[:-1], bounds[1:])]
+    solution = _new_solution(np.empty(yin.shape),
+                             np.empty(yin.shape, dtype=bool))
+    for start, end, future in zip(bounds[:-1], bounds[1:], futures):
+        _fill_solution(solution, slice(start, end), future.result())
+    return solution
+
+
+def _new_solution(x, converged):
+    # Solution of values obtained without solving, e.g. from a table
+    return _Solution(x, converged, np.full(x.shape, np.nan),
+                     np.zeros(x.shape, dtype=int),
+                     np.zeros(x.shape, dtype=int))
+
+
+def _fill_solution(solution, where, part):
+    for values, partvalues in zip(solution, part):
+        values[where] = partvalues
+
+
+def _parse_limits(xtol, rtol, max_fev, deadline, tstart):
+    # Keyword arguments of the solvers for the limits given in a call, with
+    # the deadline as a time of default_timer
+    limits = {}
+    for name, tol in (('xtol', xtol), ('rtol', rtol)):
+        if tol is not None:
+            if not tol >= 0:
+                raise ValueError("%s must be non-negative" % name)
+            limits[name] = float(tol)
+    if max_fev is not None:
+        if int(max_fev) != max_fev or max_fev < 1:
+            raise ValueError("max_fev must be a positive integer")
+        limits['max_fev'] = int(max_fev)
+    if deadline is not None:
+        if not deadline >= 0:
+            raise ValueError("deadline must be non-negative")
+        limits['deadline'] = tstart + deadline
+    return limits
+
+
+def _check_out(out, shape, dtype):
+    if out.shape != shape:
+        raise ValueError("out must have the shape %s of the values"
+                         % str(shape))
+    if dtype is not None and np.dtype(dtype) != out.dtype:
+        raise ValueError("dtype must match the dtype of out")
+
+
+def _parse_verify(verify):
+    # Maximum number of results verified by evaluating the function again:
+    # None for all of them, 0 for no verification at all
+    error_verify = "verify must be 'full', 'sample:<n>' or 'none'"
+    if verify == 'full':
+        return None
+    if verify == 'none':
+        return 0
+    if isinstance(verify, str) and verify.startswith('sample:'):
+        try:
+            nsample = int(verify[len('sample:'):])
+        except ValueError:
+            raise ValueError(error_verify)
+        if nsample < 1:
+            raise ValueError("The number of samples in verify must be "
+                             "positive")
+        return nsample
+    raise ValueError(error_verify)
+
+
+def _verify_residual(func, args, yin, results, resultsmask, residual,
+                     nsample=None, elementwise=False):
+    # Fills in place the residual of the converged results that the solver
+    # did not provide, evaluating the function for at most `nsample` of
+    # them. Returns the number of evaluations
+    idx = np.flatnonzero(resultsmask & np.isnan(residual))
+    if nsample is not None and idx.size > nsample:
+        idx = idx[np.linspace(0, idx.size - 1, nsample).astype(int)]
+    if idx.size > 0:
+        if elementwise:
+            args = tuple(a[idx] for a in args)
+        fx = np.asarray(func(results[idx], *args), dtype=np.float64)
+        residual[idx] = np.abs(fx - yin[idx])
+    return idx.size
+
+
+def _check_image(yin, ymin, ymax, min_open, max_open):
+    # Raises for values out of the image, whose limits may be given for
+    # each of the values as arrays
+    if ymin is not None:
+        with np.errstate(invalid='ignore'):
+            mask = np.where(min_open, yin <= ymin, yin < ymin)
+        if mask.any():
+            if np.ndim(ymin) == 0:
                 raise ValueError("Requested values %s lower than the"
                                  " lower limit %g of the image" %
                                  (yin[mask], ymin))
-        if ymax is not None:
-            if (xmax_open and trend == 1) or (xmin_open and trend == -1):
-                mask = yin >= ymax
-            else:
-                mask = yin > ymax
-            if yin[mask].size > 0:
+            raise ValueError("Requested values %s lower than the lower"
+                             " limits %s of the image for their args" %
+                             (yin[mask], ymin[mask]))
+    if ymax is not None:
+        with np.errstate(invalid='ignore'):
+            mask = np.where(max_open, yin >= ymax, yin > ymax)
+        if mask.any():
+            if np.ndim(ymax) == 0:
                 raise ValueError("Requested values %s higher than the"
                                  " higher limit %g of the image" %
                                  (yin[mask], ymax))
+            raise ValueError("Requested values %s higher than the higher"
+                             " limits %s of the image for their args" %
+                             (yin[mask], ymax[mask]))
+
+
+def _solve_batch(problem, yin, shape, batch_shape, xtol=1e-11, rtol=1.48e-08,
+                 max_fev=None, deadline=None):
+    # Solves for the inverse of the values of a batch of functions, each of
+    # them with its own domain and trend, evaluating all the channels with a
+    # single call to the function per iteration
+    def channels(a):
+        return _channel_values(a, shape, batch_shape)
+    refs = tuple(channels(ref) for ref in problem.refs)
+    frefs = tuple(channels(fref) for fref in problem.frefs)
+    buffer = refs[0].copy()
+    func, fprime, fprime2 = [None if f is None else
+                             _ChannelFunc(f, problem.args, buffer, shape)
+                             for f in (problem.func,) + problem.derivatives]
+    return _solve_vectorized(func, (np.arange(yin.size),), yin,
+                             tuple(channels(end) for end in problem.domain),
+                             problem.open_domain, channels(problem.trend),
+                             refs, frefs, xtol, rtol, (fprime, fprime2),
+                             elementwise=True, max_fev=max_fev,
+                             deadline=deadline)
+
+
+def _verify_batch(problem, yin, shape, batch_shape, results, resultsmask,
+                  residual):
+    # Fills in place the residual of the converged results that the solver
+    # did not provide, evaluating the batch of functions once at the results
+    # (and at the reference point of the rest of the values)
+    idx = np.flatnonzero(resultsmask & np.isnan(residual))
+    if idx.size > 0:
+        x = _channel_values(problem.refs[0], shape, batch_shape).copy()
+        x[idx] = results[idx]
+        fx = np.broadcast_to(problem.func(x.reshape(shape), *problem.args),
+                             shape).reshape(-1)
+        residual[idx] = np.abs(fx[idx] - yin[idx])
+    return idx.size
+
+
+def _solve_family(problem, yin, args, image, xtol=1e-11, rtol=1.48e-08,
+                  max_fev=None, deadline=None):
+    # Solves for the inverse of the values with their own arrays of args,
+    # with the trend and the image of the function calculated for each of
+    # them
+    func = problem.func
+    xmin, xmax = problem.domain
+    xmin_open, xmax_open = problem.open_domain
+    ref1, ref2 = problem.refs
+    shape = yin.shape
+    with np.errstate(all='ignore'):
+        fref1 = np.broadcast_to(func(ref1, *args), shape).astype(np.float64)
+        fref2 = np.broadcast_to(func(ref2, *args), shape).astype(np.float64)
+    trend = np.sign(fref2 - fref1)
+    if not (np.abs(trend) == 1).all():
+        raise ValueError("Function is not strictly monotonic for args %s" %
+                         str(tuple(a[np.abs(trend) != 1] for a in args)))
+
+    increasing = trend == 1
+    ends = []
+    for x in (xmin, xmax):
+        if x is None:
+            ends.append(None)
+            continue
+        with np.errstate(all='ignore'):
+            with warnings.catch_warnings(record=True):
+                ends.append(np.broadcast_to(func(x, *args),
+                                            shape).astype(np.float64))
+    fmin, fmax = ends
+    ymin, ymax = image
+    if ymin is None and (fmin is not None or fmax is not None):
+        ymin = np.full(shape, -np.inf)
+        if fmin is not None:
+            ymin[increasing] = fmin[increasing]
+        if fmax is not None:
+            ymin[~increasing] = fmax[~increasing]
+    if ymax is None and (fmin is not None or fmax is not None):
+        ymax = np.full(shape, np.inf)
+        if fmax is not None:
+            ymax[increasing] = fmax[increasing]
+        if fmin is not None:
+            ymax[~increasing] = fmin[~increasing]
+    _check_image(yin, ymin, ymax,
+                 np.where(increasing, xmin_open, xmax_open),
+                 np.where(increasing, xmax_open, xmin_open))
+
+    solution = _solve_vectorized(func, args, yin, problem.domain,
+                                 problem.open_domain, trend, problem.refs,
+                                 (fref1, fref2), xtol, rtol,
+                                 problem.derivatives, elementwise=True,
+                                 max_fev=max_fev, deadline=deadline)
+    # Evaluations at the reference points and at the ends of the domain
+    solution.nfev[...] += 2 + sum(end is not None for end in ends)
+    return solution
+
+
+def _make_executor(executor, workers):
+    if executor == 'thread':
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(workers)
+    elif executor == 'process':
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(workers)
+    return executor
 
-        results = yin.copy() * np.nan
-        resultsmask = np.zeros(yin.shape, dtype=bool)
-
-        for j in range(yin.size):
-            if xmax is not None:
-                if bounded_f(xmax) == yin[j]:
-                    results[j] = xmax
-                    resultsmask[j] = True
-                    continue
-            if xmin is not None:
-                if bounded_f(xmin) == yin[j]:
-                    results[j] = xmin
-                    resultsmask[j] = True
-                    continue
 
+def _solve_brent(bounded_f, yin, fends, min_kwargs, ydir=0, trend=1,
+                 max_fev=None, deadline=None, skeleton=None):
+    results = np.full(yin.shape, np.nan)
+    resultsmask = np.zeros(yin.shape, dtype=bool)
+    residual = np.full(yin.shape, np.nan)
+    nfev = np.zeros(yin.shape, dtype=int)
+    nit = np.zeros(yin.shape, dtype=int)
+    ref1, ref2 = min_kwargs['bracket']
+    # Brackets around each of the values from the skeleton, if any
+    if skeleton is not None:
+        lo, hi, glo, _ = _skeleton_brackets(yin, trend, (ref1, ref2),
+                                            (np.nan, np.nan), skeleton)
+        # Values that are exactly the image of a point of the skeleton
+        hit = glo == 0
+        results[hit] = lo[hit]
+        resultsmask[hit] = True
+        residual[hit] = 0.
+    # Imported here, as importing scipy is slow and only this solver uses it
+    from scipy.optimize import minimize_scalar
+
+    # Values that are exactly the image of one of the ends of the domain
+    for (x, fx) in fends[::-1]:
+        if fx is not None:
+            hit = ~resultsmask & (yin == fx)
+            results[hit] = x
+            resultsmask[hit] = True
+            residual[hit] = 0.
+
+    for j in range(yin.size):
+        if resultsmask[j]:
+            continue
+        if deadline is not None and default_timer() >= deadline:
+            # The rest of the values are left unsolved
+            break
+
+        kwargs = min_kwargs
+        if skeleton is not None:
+            kwargs = dict(min_kwargs, bracket=(lo[j], hi[j]))
+        if ydir != 0 and j > 0 and resultsmask[j - 1]:
+            # Sorted values: starting from the previous solution, towards
+            # the secant extrapolation from the two previous solutions
+            if yin[j] == yin[j - 1]:
+                results[j] = results[j - 1]
+                resultsmask[j] = True
+                residual[j] = residual[j - 1]
+                continue
+            xprev = results[j - 1]
+            step = trend * ydir * (ref2 - ref1)
+            if j > 1 and resultsmask[j - 2] and yin[j - 1] != yin[j - 2]:
+                slope = ((results[j - 1] - results[j - 2]) /
+                         (yin[j - 1] - yin[j - 2]))
+                if slope != 0 and np.isfinite(slope):
+                    step = slope * (yin[j] - yin[j - 1])
+            kwargs = dict(min_kwargs, bracket=(xprev, xprev + step))
+
+        if max_fev is None and deadline is None:
             optimizer = (lambda x, j=j,
                          bounded_f=bounded_f: (((bounded_f(x) - yin[j]))**2))
-            try:
-                with warnings.catch_warnings(record=True):
-                    result = minimize_scalar(optimizer, **min_kwargs)
-                results[j] = result.x
-                resultsmask[j] = result.success
-            except:
-                resultsmask[j] = False
-        if any(~resultsmask):
-            warnings.warn("Trouble calculating inverse for values: "
-                          "%s" % str(yin[~resultsmask]), RuntimeWarning)
+        else:
+            optimizer = _LimitedObjective(bounded_f, yin[j], max_fev,
+                                          deadline)
+        try:
+            with warnings.catch_warnings(record=True):
+                result = minimize_scalar(optimizer, **kwargs)
+            results[j] = result.x
+            resultsmask[j] = result.success
+            # The minimized value is the squared residual
+            residual[j] = np.sqrt(result.fun)
+            nfev[j] += result.nfev
+            nit[j] = result.nit
+        except _Exhausted:
+            # Best point evaluated before running out of evaluations or time
+            results[j] = optimizer.xbest
+            residual[j] = np.sqrt(optimizer.fbest)
+            nfev[j] += optimizer.nfev
+        except:
+            resultsmask[j] = False
+    return _Solution(results, resultsmask, residual, nfev, nit)
 
+
+class _Exhausted(Exception):
+    pass
+
+
+class _LimitedObjective(object):
+    r"""Squared residual of the bounded function for the value `y`,
+    raising `_Exhausted` when it is called after `max_fev` evaluations or
+    after the `deadline`, and keeping the best point evaluated."""
+
+    def __init__(self, bounded_f, y, max_fev=None, deadline=None):
+        self.bounded_f = bounded_f
+        self.y = y
+        self.max_fev = max_fev
+        self.deadline = deadline
+        self.nfev = 0
+        self.xbest = np.nan
+        self.fbest = np.nan
+
+    def __call__(self, x):
+        if ((self.max_fev is not None and self.nfev >= self.max_fev) or
+                (self.deadline is not None and
+                 default_timer() >= self.deadline)):
+            raise _Exhausted
+        self.nfev += 1
+        fx = (self.bounded_f(x) - self.y)**2
+        if not fx >= self.fbest:
+            self.xbest, self.fbest = float(x), fx
+        return fx
+
+
+def _scipy_available():
+    # Whether scipy can be imported, without importing it
+    try:
+        from importlib.util import find_spec
+    except ImportError:
         try:
-            np.testing.assert_array_almost_equal(yin, func(results, *args),
-                                                 decimal=accuracy)
-        except AssertionError:
-            warnings.warn("Results obtained with less than %g "
-                          "decimal digits of accuracy"
-                          % accuracy, RuntimeWarning)
+            import scipy
+        except ImportError:
+            return False
+        return True
+    return find_spec('scipy') is not None
 
-        return results.reshape(shapein)
 
-    if y_values is None:
-        return inv
+def _end_images(func, args, domain, open_domain, trend):
+    # Pairs of each end of the domain and the value of the bounded function
+    # there, or None for infinite ends
+    ends = []
+    for x in domain:
+        fx = None
+        if x is not None:
+            with np.errstate(all='ignore'):
+                with warnings.catch_warnings(record=True):
+                    fx = _bounded_func(func, args, x, domain, open_domain,
+                                       trend)
+        ends.append((x, fx))
+    return tuple(ends)
+
+
+def _sort_direction(yin):
+    # 1 if the values are sorted in ascending order, -1 if in descending
+    # order, and 0 otherwise
+    if yin.size < 2:
+        return 0
+    diff = np.diff(yin)
+    if (diff >= 0).all():
+        return 1
+    if (diff <= 0).all():
+        return -1
+    return 0
+
+
+def _bounded_problem(problem, x):
+    # Bounded function of a problem, for the scalar solvers
+    return _bounded_func(problem.func, problem.args, x, problem.domain,
+                         problem.open_domain, problem.trend)
+
+
+def _inside_domain(x, domain, open_domain):
+    # Mask of the points inside the domain, excluding its open ends
+    xmin, xmax = domain
+    xmin_open, xmax_open = open_domain
+    inside = ~np.isnan(x)
+    if xmin is not None:
+        inside &= (x > xmin) | ((x == xmin) & (not xmin_open))
+    if xmax is not None:
+        inside &= (x < xmax) | ((x == xmax) & (not xmax_open))
+    return inside
+
+
+def _bounded_func(func, args, x, domain, open_domain, trend,
+                  elementwise=False):
+    # Bounded function, returning -Inf/Inf outside the domain, for scalars
+    # or ndarrays of points. With `elementwise`, the trend and each of the
+    # args are arrays with a value for each of the points
+    xmin, xmax = domain
+    xmin_open, xmax_open = open_domain
+    if not elementwise and np.ndim(x) == 0:
+        # Plain comparisons are much faster for the scalar solvers
+        if xmin is not None and (x < xmin or (x == xmin and xmin_open)):
+            return -1 * np.inf * trend
+        if xmax is not None and (x > xmax or (x == xmax and xmax_open)):
+            return np.inf * trend
+        return func(x, *args)
+    x = np.asarray(x, dtype=np.float64)
+    below = np.zeros(x.shape, dtype=bool)
+    above = np.zeros(x.shape, dtype=bool)
+    if xmin is not None:
+        below = (x < xmin) | ((x == xmin) & xmin_open)
+    if xmax is not None:
+        above = (x > xmax) | ((x == xmax) & xmax_open)
+    inside = ~(below | above)
+    val = np.empty(x.shape)
+    trend = np.broadcast_to(trend, x.shape)
+    val[below] = -1 * np.inf * trend[below]
+    val[above] = np.inf * trend[above]
+    if inside.all():
+        val[...] = func(x, *args)
+    elif inside.any():
+        if elementwise:
+            args = tuple(a[inside] for a in args)
+        val[inside] = func(x[inside], *args)
+    return val
+
+
+def _solve_vectorized(func, args, yin, domain, open_domain, trend,
+                      refs, frefs, xtol=1e-11, rtol=1.48e-08,
+                      derivatives=(None, None), ydir=0, stride=16,
+                      elementwise=False, max_fev=None, deadline=None,
+                      skeleton=None):
+    # With `elementwise`, the trend, the values of the function at the
+    # reference points, each of the args and any end of the domain that is
+    # not a scalar are arrays with a value for each of the values. The
+    # elements that reach `max_fev` evaluations, or all of them after the
+    # `deadline`, are stopped with their best estimate. The initial
+    # brackets are taken from the `skeleton` if given
+
+    def select(idx):
+        if elementwise:
+            return (tuple(a[idx] for a in args), trend[idx],
+                    tuple(d if np.ndim(d) == 0 else d[idx] for d in domain))
+        return args, trend, domain
+
+    nfev = np.zeros(yin.shape, dtype=int)
+
+    def g(x, idx):
+        argsidx, trendidx, domainidx = select(idx)
+        nfev[idx] += 1
+        return trendidx * (_bounded_func(func, argsidx, x, domainidx,
+                                         open_domain, trendidx,
+                                         elementwise) - yin[idx])
+
+    exhausted = None
+    if max_fev is not None or deadline is not None:
+        def _exhausted(idx):
+            if max_fev is None:
+                stop = np.zeros(idx.shape, dtype=bool)
+            else:
+                stop = nfev[idx] >= max_fev
+            if deadline is not None and default_timer() >= deadline:
+                stop[...] = True
+            return stop
+        exhausted = _exhausted
+
+    lo, hi, glo, ghi = _skeleton_brackets(yin, trend, refs, frefs, skeleton)
+    if ydir != 0 and yin.size > 2 * stride and not elementwise:
+        # Sorted values: solving first one every `stride` values, and using
+        # the solutions as brackets for the values in between
+        sub = np.append(np.arange(0, yin.size - 1, stride), yin.size - 1)
+        subsolution = _solve_vectorized(func, args, yin[sub], domain,
+                                        open_domain, trend, refs, frefs,
+                                        xtol, rtol, derivatives,
+                                        max_fev=max_fev, deadline=deadline,
+                                        skeleton=skeleton)
+        xsub, oksub = subsolution.x, subsolution.converged
+        nfev[sub] += subsolution.nfev + 1
+        with np.errstate(all='ignore'):
+            fsub = _bounded_func(func, args, np.where(oksub, xsub, refs[0]),
+                                 domain, open_domain, trend)
+        k = np.minimum(np.arange(yin.size) // stride, sub.size - 2)
+        first, second = k, k + 1
+        if trend * ydir < 0:
+            first, second = second, first
+        bracketed = oksub[first] & oksub[second]
+        lo[bracketed] = xsub[first][bracketed]
+        hi[bracketed] = xsub[second][bracketed]
+        glo[bracketed] = trend * (fsub[first] - yin)[bracketed]
+        ghi[bracketed] = trend * (fsub[second] - yin)[bracketed]
+        # Brackets broken by the accuracy of the first solutions are
+        # expanded as usual
+        broken = ~((glo <= 0) & (ghi >= 0))
+        for values, initial in zip((lo, hi, glo, ghi), _skeleton_brackets(
+                yin[broken], trend, refs, frefs, skeleton)):
+            values[broken] = initial
+    _expand_brackets(g, lo, hi, glo, ghi, *domain, exhausted=exhausted)
+    fprime, fprime2 = derivatives
+    if fprime is None:
+        results, resultsmask, nit, residual = _illinois(
+            g, lo, hi, glo, ghi, xtol, rtol, exhausted=exhausted)
     else:
-        return inv(y_values)
+        def dg(x, idx):
+            argsidx, trendidx, _ = select(idx)
+            return trendidx * fprime(x, *argsidx)
+
+        def d2g(x, idx):
+            argsidx, trendidx, _ = select(idx)
+            return trendidx * fprime2(x, *argsidx)
+        results, resultsmask, nit, residual = _newton(
+            g, lo, hi, glo, ghi, dg, d2g if fprime2 is not None else None,
+            xtol, rtol, exhausted=exhausted)
+    return _Solution(results, resultsmask, residual, nfev, nit)
+
+
+def _skeleton_brackets(yin, trend, refs, frefs, skeleton=None):
+    # Brackets of the values between the consecutive points of the skeleton
+    # around them, or between the reference points for the values outside
+    # the skeleton, with the values of g = trend * (f - y) at both ends
+    lo = np.full(yin.shape, refs[0], dtype=np.float64)
+    hi = np.full(yin.shape, refs[1], dtype=np.float64)
+    glo = trend * (frefs[0] - yin)
+    ghi = trend * (frefs[1] - yin)
+    if skeleton is not None:
+        xs, fs = skeleton
+        k = np.searchsorted(trend * fs, trend * yin, side='right')
+        inside = (k > 0) & (k < xs.size)
+        k = k[inside]
+        lo[inside] = xs[k - 1]
+        hi[inside] = xs[k]
+        glo[inside] = trend * (fs[k - 1] - yin[inside])
+        ghi[inside] = trend * (fs[k] - yin[inside])
+    return lo, hi, glo, ghi
+
+
+def _build_skeleton(func, args, domain, open_domain, trend, decades=300,
+                    per_decade=8):
+    r"""Values of the function at points spaced logarithmically in their
+    distance to the finite end of a half-bounded domain, or to 0 for the
+    whole real line, with `per_decade` points per decade over +-`decades`
+    decades. Distances below the spacing of the floating point numbers at
+    the finite end are dropped, as they round to the end itself.
+
+    The function is evaluated once with all the points, and only those
+    where it is finite and strictly monotonic are kept, as a tuple of
+    arrays `(x, f(x))` sorted in x, or None for a bounded domain, if the
+    function cannot be evaluated with an ndarray or if less than two
+    points are left.
+
+    """
+    xmin, xmax = domain
+    xmin_open, xmax_open = open_domain
+    distances = np.logspace(-decades, decades,
+                            2 * decades * per_decade + 1)
+    if xmin is None and xmax is None:
+        x = np.concatenate([-distances, [0.], distances])
+    elif xmax is None:
+        x = xmin + distances[distances >= np.spacing(abs(xmin))]
+    elif xmin is None:
+        x = xmax - distances[distances >= np.spacing(abs(xmax))]
+    else:
+        return None
+    x = np.unique(np.concatenate([x] + [[end] for end in domain
+                                        if end is not None]))
+    inside = np.isfinite(x)
+    if xmin is not None:
+        inside &= (x > xmin) if xmin_open else (x >= xmin)
+    if xmax is not None:
+        inside &= (x < xmax) if xmax_open else (x <= xmax)
+    x = x[inside]
+    try:
+        with np.errstate(all='ignore'):
+            with warnings.catch_warnings(record=True):
+                fx = np.asarray(func(x, *args), dtype=np.float64)
+    except Exception:
+        return None
+    if fx.shape != x.shape:
+        return None
+    finite = np.isfinite(fx)
+    x, fx = x[finite], fx[finite]
+    # Keeping the points above the maximum of the previous ones
+    monotonic = np.ones(x.shape, dtype=bool)
+    monotonic[1:] = trend * fx[1:] > np.maximum.accumulate(trend * fx)[:-1]
+    if monotonic.sum() < 2:
+        return None
+    return x[monotonic], fx[monotonic]
+
+
+def _finite_image(func, args, domain, open_domain, trend, ymin, ymax):
+    # Finite interval of the image, replacing infinite or unknown limits
+    # by the extreme finite values of the function close to the ends
+    u = 1. - 2.**-np.arange(1, 53)
+    to_x, _ = _domain_transform(domain, open_domain)
+    with np.errstate(all='ignore'):
+        with warnings.catch_warnings(record=True):
+            y = np.asarray(func(to_x(np.concatenate([-u, u])), *args),
+                           dtype=np.float64)
+    y = y[np.isfinite(y)]
+    ylo = ymin if ymin is not None and np.isfinite(ymin) else y.min()
+    yhi = ymax if ymax is not None and np.isfinite(ymax) else y.max()
+    return ylo, yhi
 
 
 def _normparams_inversefunc(domain, image, open_domain, args):
@@ -1,6 +1,7 @@
 import numpy as np
 from numpy.testing import (assert_array_equal, assert_almost_equal,
-                           assert_array_almost_equal, assert_equal, assert_)
+                           assert_array_almost_equal, assert_equal, assert_,
+                           assert_raises)
 
 from pynverse import inversefunc
 
@@ -105,3 +106,763 @@ def test_inversefunc_with_multargs():
     yval = [-24, -5, 2, 3, 4, 11, 30]
     xvalexpected = [-3, -2, -1, 0, 1, 2, 3]
     assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+
+def test_inversefunc_vectorized():
+    accuracy = 2
+    cases = [((lambda x: x**3), {},
+              [-27, -8, -1, 0, 1, 8, 27], [-3, -2, -1, 0, 1, 2, 3]),
+             ((lambda x: x**2), {'domain': 0},
+              [0, 4, 16, 64], [0, 2, 4, 8]),
+             ((lambda x: np.log10(x)), {'domain': 0, 'open_domain': True,
+                                         'image': [-np.inf, None]},
+              [-2., -3.], [0.01, 0.001]),
+             ((lambda x: np.cos(x)), {'domain': [0, np.pi]},
+              [1, 0, -1], [0., np.pi / 2, np.pi]),
+             ((lambda x: np.tan(x)), {'domain': [-np.pi / 2, np.pi / 2],
+                                       'open_domain': True},
+              [1, 0, -1], [np.pi / 4, 0., -np.pi / 4])]
+    for func, kwargs, yval, xvalexpected in cases:
+        invfunc = inversefunc(func, method='vectorized', **kwargs)
+        assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+
+def test_inversefunc_vectorized_large():
+    yval = np.linspace(-1e3, 1e3, 10001).reshape(73, 137)
+    xval = inversefunc(lambda x: x**3 + x, y_values=yval,
+                       method='vectorized')
+    assert_equal(xval.shape, yval.shape)
+    assert_array_almost_equal(xval**3 + xval, yval, 3)
+
+def test_inversefunc_bad_method():
+    assert_raises(ValueError, inversefunc, np.exp, method='secant')
+
+def test_inversefunc_table():
+    accuracy = 2
+    cases = [((lambda x: x**3), {},
+              [-27, -8, -1, 0, 1, 8, 27], [-3, -2, -1, 0, 1, 2, 3]),
+             ((lambda x: x**2), {'domain': [None, 0]},
+              [0, 4, 16, 64], [0, -2, -4, -8]),
+             ((lambda x: np.log10(x)), {'domain': 0, 'open_domain': True,
+                                         'image': [-np.inf, None]},
+              [-2., -3.], [0.01, 0.001]),
+             ((lambda x: np.tan(x)), {'domain': [-np.pi / 2, np.pi / 2],
+                                       'open_domain': True},
+              [1, 0, -1], [np.pi / 4, 0., -np.pi / 4])]
+    for func, kwargs, yval, xvalexpected in cases:
+        invfunc = inversefunc(func, method='table', **kwargs)
+        assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+
+def test_inversefunc_table_tolerance():
+    invfunc = inversefunc(np.exp, method='table', tolerance=1e-8)
+    yval = np.logspace(-200, 1, 1001)
+    assert_array_almost_equal(invfunc(yval), np.log(yval), 6)
+    for tolerance in [0., -1e-3]:
+        assert_raises(ValueError, inversefunc, np.exp, method='table',
+                      tolerance=tolerance)
+
+def test_inversefunc_table_residual():
+    import warnings
+    accuracy = 2
+    cases = [((lambda x: x**3), {}, (-1e3, 1e3)),
+             ((lambda x: np.tan(x)), {'domain': [-np.pi / 2, np.pi / 2],
+                                       'open_domain': True}, (-1e3, 1e3))]
+    yval = np.random.RandomState(0).uniform(size=2000)
+    for func, kwargs, (ymin, ymax) in cases:
+        invfunc = inversefunc(func, method='table', accuracy=accuracy,
+                              **kwargs)
+        # The default tolerance passes the verification of the results
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            xval, info = invfunc(ymin + (ymax - ymin) * yval,
+                                 full_output=True)
+        assert_(np.all(info['residual'] < 1.5 * 10. ** -accuracy))
+
+def test_inversefunc_chebyshev():
+    accuracy = 2
+    cases = [((lambda x: x**3), {},
+              [-27, -8, -1, 0, 1, 8, 27], [-3, -2, -1, 0, 1, 2, 3]),
+             ((lambda x: np.log10(x)), {'domain': 0, 'open_domain': True,
+                                         'image': [-np.inf, None]},
+              [-2., -3.], [0.01, 0.001]),
+             ((lambda x: np.cos(x)), {'domain': [0, np.pi]},
+              [1, 0, -1], [0., np.pi / 2, np.pi]),
+             ((lambda x: np.tan(x)), {'domain': [-np.pi / 2, np.pi / 2],
+                                       'open_domain': True},
+              [1, 0, -1], [np.pi / 4, 0., -np.pi / 4])]
+    for func, kwargs, yval, xvalexpected in cases:
+        invfunc = inversefunc(func, method='chebyshev', **kwargs)
+        assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+
+def test_inversefunc_chebyshev_domain():
+    import warnings
+    accuracy = 2
+    invfunc = inversefunc(np.log10, domain=0, open_domain=True,
+                          image=[-np.inf, None], method='chebyshev')
+    yval = np.random.RandomState(0).uniform(-10, 10, 10**4)
+    # Never evaluated out of the domain when verifying the results
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        xval, info = invfunc(yval, full_output=True)
+    assert_((xval > 0).all())
+    assert_(np.all(info['residual'] < 1.5 * 10. ** -accuracy))
+
+def test_inversefunc_chebyshev_tolerance():
+    invfunc = inversefunc(np.tan, domain=[-np.pi / 2, np.pi / 2],
+                          open_domain=True, method='chebyshev',
+                          tolerance=1e-10)
+    yval = np.linspace(-1e3, 1e3, 10001)
+    assert_array_almost_equal(invfunc(yval), np.arctan(yval), 10)
+    # Rejected before bisecting the image down to the maximum of pieces
+    for tolerance in [0., -1.]:
+        assert_raises(ValueError, inversefunc, np.exp, method='chebyshev',
+                      tolerance=tolerance)
+
+def test_inversefunc_fprime():
+    accuracy = 2
+    cube = (lambda x: x**3)
+    invfunc = inversefunc(cube, fprime=(lambda x: 3 * x**2))
+    yval = [-27, -8, -1, 0, 1, 8, 27]
+    xvalexpected = [-3, -2, -1, 0, 1, 2, 3]
+    assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+
+def test_inversefunc_fprime_vminopenvmaxopen():
+    accuracy = 2
+    tan = (lambda x: np.tan(x))
+    invfunc = inversefunc(tan,
+                          domain=[-np.pi / 2, np.pi / 2],
+                          open_domain=True,
+                          fprime=(lambda x: 1 / np.cos(x)**2),
+                          fprime2=(lambda x: 2 * np.tan(x) / np.cos(x)**2))
+    yval = [1, 0, -1]
+    xvalexpected = [np.pi / 4, 0., -np.pi / 4]
+    assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+
+def test_inversefunc_fprime_with_args():
+    accuracy = 2
+    func = (lambda x, y, z: x**3 + y + z)
+    fprime = (lambda x, y, z: 3 * x**2)
+    invfunc = inversefunc(func, args=(1, 2), fprime=fprime)
+    yval = [-24, -5, 2, 3, 4, 11, 30]
+    xvalexpected = [-3, -2, -1, 0, 1, 2, 3]
+    assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+
+def test_inversefunc_newton_requires_fprime():
+    assert_raises(ValueError, inversefunc, np.exp, method='newton')
+    assert_raises(ValueError, inversefunc, np.exp, method='halley',
+                  fprime=np.exp)
+
+def test_inversefunc_sorted():
+    accuracy = 6
+    func = (lambda x: x**3 + x)
+    yval = np.linspace(-1e3, 1e3, 1001)
+    for kwargs in [{}, {'method': 'vectorized'},
+                   {'fprime': (lambda x: 3 * x**2 + 1)}]:
+        invfunc = inversefunc(func, **kwargs)
+        xval = invfunc(yval, presorted=False)
+        assert_array_almost_equal(invfunc(yval), xval, accuracy)
+        assert_array_almost_equal(invfunc(yval[::-1]), xval[::-1], accuracy)
+        assert_array_almost_equal(invfunc(yval, presorted=True), xval,
+                                  accuracy)
+
+def test_inversefunc_sorted_decreasing():
+    accuracy = 2
+    func = (lambda x: -np.log10(x))
+    invfunc = inversefunc(func, domain=0, open_domain=True,
+                          image=[None, np.inf], method='vectorized')
+    yval = np.linspace(-2, 3, 101)
+    assert_array_almost_equal(invfunc(yval), 10**-yval, accuracy)
+
+def test_inversefunc_workers():
+    accuracy = 2
+    yval = np.linspace(-27, 27, 101)
+    xvalexpected = np.cbrt(yval)
+    for executor in ['thread', 'process']:
+        for method in ['brent', 'vectorized']:
+            invfunc = inversefunc(np.power, args=3, workers=2,
+                                  executor=executor, method=method)
+            assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+
+def test_inversefunc_workers_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    accuracy = 2
+    cube = (lambda x: x**3)
+    yval = [-27, -8, -1, 0, 1, 8, 27]
+    xvalexpected = [-3, -2, -1, 0, 1, 2, 3]
+    with ThreadPoolExecutor(2) as executor:
+        invfunc = inversefunc(cube, workers=2, executor=executor)
+        assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+        # Executors given by the user are not shut down
+        invfunc.close()
+        assert_equal(executor.submit(abs, -1).result(), 1)
+    assert_raises(ValueError, inversefunc, cube, executor='fiber')
+
+def test_inversefunc_workers_close():
+    import gc
+    accuracy = 2
+    yval = np.linspace(-27, 27, 101)
+    xvalexpected = np.cbrt(yval)
+    with inversefunc(np.power, args=3, workers=2, executor='process',
+                     method='vectorized') as invfunc:
+        assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+        pool = invfunc._pool
+    assert_raises(RuntimeError, pool.submit, abs, -1)
+    # A new pool is created when needed after closing
+    assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+    pool = invfunc._pool
+    del invfunc
+    gc.collect()
+    assert_raises(RuntimeError, pool.submit, abs, -1)
+
+def test_inversefunc_workers_threads():
+    import threading
+    accuracy = 2
+    yval = np.linspace(-27, 27, 101)
+    invfunc = inversefunc(np.power, args=3, workers=2, method='vectorized')
+    barrier = threading.Barrier(8)
+    pools = []
+    results = []
+
+    def first_call():
+        barrier.wait()
+        results.append(invfunc(yval))
+        pools.append(invfunc._pool)
+    threads = [threading.Thread(target=first_call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # A single pool, shared by all the first calls
+    assert_equal(len(set(map(id, pools))), 1)
+    for xval in results:
+        assert_array_almost_equal(xval, np.cbrt(yval), accuracy)
+    invfunc.close()
+
+def test_inversefunc_cache():
+    accuracy = 2
+    calls = []
+    cube = (lambda x: calls.append(np.size(x)) or x**3)
+    invfunc = inversefunc(cube, method='vectorized', cache_size=4)
+    yval = [-27, -8, -1, 0, 1, 8, 27]
+    xvalexpected = [-3, -2, -1, 0, 1, 2, 3]
+    assert_array_almost_equal(invfunc(yval), xvalexpected, accuracy)
+    info = invfunc.cache_info()
+    assert_equal((info.hits, info.misses, info.evictions, info.currsize),
+                 (0, 7, 3, 4))
+    del calls[:]
+    assert_array_almost_equal(invfunc([1, 8, 27]), [1, 2, 3], accuracy)
+    # Only the accuracy check evaluates the function
+    assert_equal(calls, [3])
+    assert_array_almost_equal(invfunc([27, -27]), [3, -3], accuracy)
+    info = invfunc.cache_info()
+    assert_equal((info.hits, info.misses), (4, 8))
+    invfunc.cache_clear()
+    assert_equal(invfunc.cache_info().currsize, 0)
+    for cache_size in [0, -1, 2.5, True]:
+        assert_raises(ValueError, inversefunc, cube, cache_size=cache_size)
+
+def test_inversefunc_cache_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    accuracy = 2
+    invfunc = inversefunc(lambda x: x**3, cache_size=50)
+    yval = np.arange(-100, 100)
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(invfunc,
+                                    [yval[i % 4::4] for i in range(8)]))
+    for i, xval in enumerate(results):
+        assert_array_almost_equal(xval, np.cbrt(yval[i % 4::4]), accuracy)
+    info = invfunc.cache_info()
+    assert_equal(info.hits + info.misses, 2 * yval.size)
+    assert_(info.currsize <= 50)
+
+def test_inversefunc_iter_chunks():
+    accuracy = 2
+    invfunc = inversefunc(lambda x: x**3, method='vectorized')
+    arrays = (np.arange(i, i + 10.).reshape(2, 5)**3 for i in range(3))
+    chunks = list(invfunc.iter_chunks(arrays, chunk_size=4))
+    assert_equal([chunk.size for chunk in chunks], [4, 4, 2] * 3)
+    assert_array_almost_equal(np.concatenate(chunks[:3]), np.arange(10.),
+                              accuracy)
+    assert_array_almost_equal(np.concatenate(chunks[-3:]),
+                              np.arange(2, 12.), accuracy)
+
+def test_inversefunc_map_file():
+    import os
+    import shutil
+    import tempfile
+    accuracy = 2
+    invfunc = inversefunc(lambda x: x**3, method='vectorized')
+    yval = np.asfortranarray(np.linspace(-27, 27, 60).reshape(6, 10))
+    tmpdir = tempfile.mkdtemp()
+    in_path = os.path.join(tmpdir, 'y.npy')
+    out_path = os.path.join(tmpdir, 'x.npy')
+    try:
+        np.save(in_path, yval)
+        invfunc.map_file(in_path, out_path, chunk_size=7)
+        xval = np.load(out_path)
+    finally:
+        shutil.rmtree(tmpdir)
+    assert_equal(xval.shape, yval.shape)
+    assert_array_almost_equal(xval, np.cbrt(yval), accuracy)
+
+def test_inversefunc_out_dtype():
+    accuracy = 2
+    invfunc = inversefunc(lambda x: x**3, method='vectorized')
+    yval = np.array([[-27, -8, -1], [1, 8, 27]], dtype=np.float32)
+    xvalexpected = [[-3, -2, -1], [1, 2, 3]]
+    xval = invfunc(yval, dtype=np.float32)
+    assert_equal(xval.dtype, np.float32)
+    assert_array_almost_equal(xval, xvalexpected, accuracy)
+    out = np.empty((3, 2)).T
+    assert_(invfunc(yval, out=out) is out)
+    assert_array_almost_equal(out, xvalexpected, accuracy)
+    out = np.empty(yval.shape, dtype=np.float32)
+    assert_(invfunc(yval, out=out) is out)
+    assert_array_almost_equal(out, xvalexpected, accuracy)
+    assert_raises(ValueError, invfunc, yval, out=np.empty(6))
+    assert_raises(ValueError, invfunc, yval, out=out, dtype=np.float64)
+
+def test_inversefunc_out_chunks():
+    from pynverse import inverse
+    accuracy = 2
+    records = []
+    invfunc = inversefunc(lambda x: x**3, method='vectorized',
+                          callback=records.append)
+    yval = np.linspace(-27, 27, 30).reshape(5, 6)
+    xvalexpected = np.cbrt(yval)
+    chunk_size = inverse._OUT_CHUNK_SIZE
+    inverse._OUT_CHUNK_SIZE = 8
+    try:
+        for out in [np.empty(yval.shape), np.empty((6, 5)).T,
+                    np.empty(yval.shape, dtype=np.float32)]:
+            del records[:]
+            assert_(invfunc(yval, out=out) is out)
+            assert_array_almost_equal(out, xvalexpected, accuracy)
+            # The solvers never see more values than a chunk
+            assert_equal([r['values'] for r in records], [8, 8, 8, 6])
+        assert_raises(ValueError, invfunc, yval, out=np.empty(30))
+    finally:
+        inverse._OUT_CHUNK_SIZE = chunk_size
+
+def test_inversefunc_verify():
+    accuracy = 2
+    calls = []
+
+    def cube(x):
+        calls.append(np.size(x))
+        return x**3
+    yval = np.linspace(-27, 27, 100)
+    for method in ['vectorized', 'brent']:
+        invfunc = inversefunc(cube, method=method)
+        del calls[:]
+        xval, info = invfunc(yval, full_output=True)
+        assert_array_almost_equal(xval, np.cbrt(yval), accuracy)
+        # The residuals of the solver are reused
+        assert_(calls[-1] < yval.size)
+        assert_(info['converged'].all() and info['verified'].all())
+        assert_(not info['failed'].any())
+        assert_(np.all(info['residual'] < 10. ** -accuracy))
+    invfunc = inversefunc(cube, method='table', verify='sample:10')
+    del calls[:]
+    xval, info = invfunc(yval, full_output=True)
+    assert_equal(calls, [10])
+    assert_equal(info['verified'].sum(), 10)
+    invfunc = inversefunc(cube, method='table', verify='none')
+    del calls[:]
+    xval, info = invfunc(yval, full_output=True)
+    assert_equal(calls, [])
+    assert_(not info['verified'].any())
+    assert_array_almost_equal(xval, np.cbrt(yval), accuracy)
+    for verify in ['sample', 'sample:0', 'some']:
+        assert_raises(ValueError, inversefunc, cube, verify=verify)
+
+def test_inversefunc_verify_failed():
+    import warnings
+    invfunc = inversefunc(lambda x: np.floor(x), method='vectorized',
+                          accuracy=4)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        xval, info = invfunc([0.5, 2.], full_output=True)
+    assert_equal(info['failed'], [True, False])
+    assert_(any('accuracy' in str(item.message) for item in w))
+
+def test_inversefunc_args_family():
+    accuracy = 2
+    invfunc = inversefunc(lambda x, a: a * x**3, args=(1.,))
+    a = np.array([-2., -1., 1., 2., 4.])
+    yval = np.array([[-16.], [2.]])
+    xval, info = invfunc(yval, args=(a,), full_output=True)
+    assert_equal(xval.shape, (2, 5))
+    assert_(info['converged'].all())
+    assert_array_almost_equal(xval, np.cbrt(yval / a), accuracy)
+    assert_raises(ValueError, invfunc, yval, args=np.array([0., 1.]))
+    invfunc = inversefunc(np.power, args=2, domain=0)
+    p = np.array([0.5, 1., 2., 3.])
+    assert_array_almost_equal(invfunc(8., args=p), 8. ** (1 / p), accuracy)
+    assert_raises(ValueError, invfunc, [-1, 1], args=[[1.], [2.]])
+
+def test_inversefunc_param_range():
+    import shutil
+    import tempfile
+    accuracy = 3
+    func = (lambda x, p: np.exp(p * x) + x)
+    invfunc = inversefunc(func, args=1., domain=[-4, 4],
+                          param_range=[0.5, 2.], accuracy=accuracy,
+                          tolerance=1e-6)
+    xexpected = np.linspace(-3, 3, 50)
+    p = np.linspace(0.5, 2., 7)[:, np.newaxis]
+    yval = func(xexpected, p)
+    xval, info = invfunc(yval, args=p, full_output=True)
+    assert_(not info['failed'].any())
+    assert_array_almost_equal(xval, np.broadcast_to(xexpected, xval.shape),
+                              accuracy)
+    assert_array_almost_equal(invfunc(func(xexpected, 1.)), xexpected,
+                              accuracy)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        invfunc.save_table(tmpdir)
+        invloaded = inversefunc(func, args=1., domain=[-4, 4],
+                                table_path=tmpdir, accuracy=accuracy)
+        assert_array_equal(invloaded(yval, args=p), xval)
+    finally:
+        shutil.rmtree(tmpdir)
+    assert_raises(ValueError, inversefunc, func, param_range=[0.5, 2.])
+    assert_raises(ValueError, inversefunc, func, args=1., method='brent',
+                  param_range=[0.5, 2.])
+
+def test_inversefunc_save_load():
+    import pickle
+    import shutil
+    import tempfile
+    from pynverse import InverseFunction
+    accuracy = 4
+    yval = [1e-3, 1., 10., 1e3]
+    xvalexpected = np.log(yval)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for method in ['table', 'chebyshev', 'vectorized']:
+            invfunc = inversefunc(np.exp, method=method, accuracy=accuracy,
+                                  tolerance=1e-8)
+            path = tmpdir + '/' + method
+            invfunc.save(path)
+            invloaded = InverseFunction.load(path)
+            assert_equal(invloaded.method, method)
+            assert_array_almost_equal(invloaded(yval), xvalexpected,
+                                      accuracy)
+            assert_array_equal(invloaded(yval), invfunc(yval))
+            invpickled = pickle.loads(pickle.dumps(invfunc))
+            assert_array_equal(invpickled(yval), invfunc(yval))
+        assert_(isinstance(InverseFunction.load(tmpdir + '/table').table.y,
+                           np.memmap))
+        invfunc = inversefunc(lambda x: np.exp(x), method='table',
+                              accuracy=accuracy, tolerance=1e-8)
+        invfunc.save(tmpdir + '/lambda')
+        assert_raises(ValueError, InverseFunction.load, tmpdir + '/lambda')
+        invloaded = InverseFunction.load(tmpdir + '/lambda', func=np.exp)
+        assert_array_almost_equal(invloaded(yval), xvalexpected, accuracy)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_inversefunc_stats():
+    evaluated = []
+
+    def cube(x):
+        evaluated.append(np.size(x))
+        return x**3
+    yval = np.linspace(-27, 27, 40)
+    for method in ['vectorized', 'brent', 'table']:
+        records = []
+        invfunc = inversefunc(cube, method=method, stats=True,
+                              callback=records.append)
+        del evaluated[:]
+        xval, info = invfunc(yval, full_output=True)
+        invfunc(yval[:10])
+        assert_equal(len(records), 2)
+        record = records[0]
+        assert_equal(record['values'], yval.size)
+        assert_equal(record['nfev'] + record['nfev_verify'] +
+                     records[1]['nfev'] + records[1]['nfev_verify'],
+                     sum(evaluated))
+        assert_equal(record['nfev'], info['nfev'].sum())
+        assert_equal(record['failures'], 0)
+        for name in ['time_check', 'time_solve', 'time_verify']:
+            assert_(0 <= record[name] <= record['time_total'])
+        stats = invfunc.stats()
+        assert_equal(stats['calls'], 2)
+        assert_equal(stats['values'], yval.size + 10)
+        assert_equal(stats['nfev'], record['nfev'] + records[1]['nfev'])
+        invfunc.stats_clear()
+        assert_equal(invfunc.stats()['calls'], 0)
+    assert_raises(ValueError, inversefunc(cube).stats)
+
+def test_inversefunc_brent_ends():
+    evaluated = []
+
+    def cos(x):
+        evaluated.append(np.size(x))
+        return np.cos(x)
+    invfunc = inversefunc(cos, domain=[0, np.pi], method='brent')
+    del evaluated[:]
+    xval, info = invfunc([1, -1, 1, 0], full_output=True)
+    assert_array_almost_equal(xval, [0, np.pi, 0, np.pi / 2])
+    assert_equal(info['nfev'][:3], [0, 0, 0])
+    assert_(sum(evaluated) <= info['nfev'].sum() + 1)
+
+def test_import_does_not_load_scipy():
+    import subprocess
+    import sys
+    code = "import sys, pynverse; print('scipy' in sys.modules)"
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert_equal(out.decode().strip(), 'False')
+
+def test_inversefunc_without_scipy():
+    from pynverse import inverse
+    accuracy = 2
+    cube = (lambda x: x**3)
+    scipy_available = inverse._scipy_available
+    inverse._scipy_available = lambda: False
+    try:
+        invfunc = inversefunc(cube)
+        assert_equal(invfunc.method, 'vectorized')
+        assert_array_almost_equal(invfunc([-8, 27]), [-2, 3], accuracy)
+        assert_raises(ImportError, inversefunc, cube, method='brent')
+    finally:
+        inverse._scipy_available = scipy_available
+
+def test_inversefunc_solve_async():
+    import asyncio
+    import time
+    cube = (lambda x: x**3)
+    records = []
+    invfunc = inversefunc(cube, method='vectorized',
+                          callback=records.append)
+    yvals = [np.linspace(-27, 27, i + 2) for i in range(8)] + [
+        np.linspace(-27, 27, 50)]
+
+    async def solve_all():
+        return await asyncio.gather(*[invfunc.solve_async(yval,
+                                                          chunk_size=20)
+                                      for yval in yvals])
+    results = asyncio.run(solve_all())
+    for yval, xval in zip(yvals, results):
+        assert_array_almost_equal(xval, np.cbrt(yval))
+    # Concurrent requests are combined into shared batches
+    assert_(len(records) < len(yvals))
+    assert_(max(record['values'] for record in records) <= 20)
+    assert_equal(invfunc._batchers, {})
+    xval = asyncio.run(invfunc.solve_async(27.))
+    assert_equal(xval.shape, ())
+    assert_almost_equal(xval, 3.)
+
+    def slowcube(x):
+        time.sleep(0.05)
+        return x**3
+    invfunc = inversefunc(slowcube, method='vectorized')
+    assert_raises(asyncio.TimeoutError, asyncio.run,
+                  invfunc.solve_async(np.arange(100.), chunk_size=10,
+                                      timeout=0.1))
+    assert_raises(ValueError, asyncio.run,
+                  inversefunc(lambda x: x**2,
+                              domain=0).solve_async([-1., 1.]))
+
+def test_inversefunc_limits():
+    import warnings
+    cube = (lambda x: x**3)
+    yval = np.array([8., -27., 1000., 0.5, -64.])
+    for method in ['vectorized', 'brent']:
+        invfunc = inversefunc(cube, method=method)
+        xval, info = invfunc(yval, full_output=True)
+        assert_(info['converged'].all())
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            xlim, infolim = invfunc(yval, full_output=True, max_fev=5)
+        assert_((infolim['nfev'] <= 5).all())
+        assert_(not infolim['converged'].all())
+        xlim, infolim = invfunc(yval, full_output=True, max_fev=10**4)
+        assert_array_almost_equal(xlim, xval)
+        # Looser tolerances need fewer evaluations
+        with warnings.catch_warnings(record=True):
+            xloose, infoloose = invfunc(yval, full_output=True, xtol=1e-3,
+                                        rtol=1e-3)
+        assert_(infoloose['converged'].all())
+        assert_(infoloose['nfev'].sum() < info['nfev'].sum())
+        assert_array_almost_equal(xloose, np.cbrt(yval), 2)
+        xlate, infolate = invfunc(yval, full_output=True, deadline=0)
+        assert_(not infolate['converged'].all())
+        assert_equal(infolate['nfev'], 0)
+    assert_raises(ValueError, invfunc, yval, max_fev=0)
+    assert_raises(ValueError, invfunc, yval, deadline=-1)
+    assert_raises(ValueError, invfunc, yval, xtol=-1e-3)
+
+def test_inversefunc_skeleton():
+    import math
+    import warnings
+    cube = (lambda x: x**3)
+    yval = np.array([-1e6, -27., 0., 1e-6, 64., 1e5])
+    for method in ['vectorized', 'brent']:
+        invfunc = inversefunc(cube, method=method)
+        xs, fs = invfunc.skeleton
+        assert_((np.diff(xs) > 0).all() and (np.diff(fs) > 0).all())
+        xval, info = invfunc(yval, full_output=True)
+        assert_array_almost_equal(xval / np.cbrt(yval + (yval == 0)),
+                                  (yval != 0), 6)
+        assert_(info['converged'].all())
+    # Starting from the brackets of the skeleton, far values take only a
+    # few more evaluations than the values close to the origin
+    invfunc = inversefunc(cube, method='vectorized')
+    near = invfunc([8.], full_output=True)[1]['nfev'][0]
+    with warnings.catch_warnings(record=True):
+        far = invfunc([8e300], full_output=True)[1]['nfev'][0]
+    assert_(far <= near + 2)
+    # Only built towards the unbounded ends, without the distances that
+    # round to the finite end
+    sizes = []
+
+    def sized_exp(x):
+        sizes.append(np.size(x))
+        return np.exp(x)
+    invfunc = inversefunc(sized_exp, domain=5, method='vectorized')
+    xs = invfunc.skeleton[0]
+    assert_(xs[0] == 5 and (np.diff(xs) > 0).all() and max(sizes) < 2600)
+    assert_almost_equal(invfunc(np.exp(7.)), 7.)
+    del sizes[:]
+    invfunc = inversefunc(sized_exp, domain=[-1, 1], method='vectorized')
+    assert_(invfunc.skeleton is None and max(sizes) == 1)
+    assert_almost_equal(invfunc(np.exp(0.5)), 0.5)
+    invfunc = inversefunc(cube, method='vectorized', skeleton=False)
+    assert_(invfunc.skeleton is None)
+    assert_almost_equal(invfunc(27.), 3.)
+    # Functions that cannot be evaluated with arrays have no skeleton
+    invfunc = inversefunc(lambda x: math.exp(x), method='brent')
+    assert_(invfunc.skeleton is None)
+    assert_almost_equal(invfunc(np.exp(2.)), 2.)
+
+def test_inversefunc_piecewise():
+    from pynverse import Piecewise, piecewise
+    evaluated = []
+
+    def segment(f):
+        def g(x):
+            evaluated.append(np.size(x))
+            return f(x)
+        return g
+    funclist = [lambda x: x, lambda x: x**2, lambda x: x + 6]
+    pw = Piecewise([1, 3], [segment(f) for f in funclist])
+    xval = np.linspace(-5, 5, 41)
+    assert_array_almost_equal(pw(xval), piecewise(
+        xval, [xval < 1, (xval >= 1) * (xval < 3), xval >= 3], funclist))
+    assert_almost_equal(pw(2.), 4.)
+    # Each segment is only evaluated at its own points
+    del evaluated[:]
+    pw(xval)
+    assert_equal(sorted(evaluated), [8, 9, 24])
+    yval = pw(xval)
+    for method in ['brent', 'vectorized', 'table', 'chebyshev']:
+        invfunc = inversefunc(pw, method=method, tolerance=1e-8)
+        assert_array_almost_equal(invfunc(yval), xval, 6)
+    invfunc = inversefunc(pw, domain=[2, 5], method='vectorized')
+    assert_equal(len(invfunc.pieces), 2)
+    assert_array_almost_equal(invfunc([4., 9., 10.]), [2., 3., 4.])
+    # Analytic inverses of the segments
+    pw = Piecewise([1, 3], funclist,
+                   inverses=[lambda y: y, None, lambda y: y - 6])
+    xval, info = inversefunc(pw)(yval, full_output=True)
+    assert_array_almost_equal(xval, np.linspace(-5, 5, 41))
+    assert_equal(info['nfev'][yval < 1], 0)
+    assert_equal(info['nfev'][yval >= 9], 0)
+    assert_raises(ValueError, Piecewise, [3, 1], funclist)
+    assert_raises(ValueError, Piecewise, [1, 3], funclist[:2])
+    decreasing = Piecewise([0], [lambda x: -x, lambda x: x])
+    assert_raises(ValueError, inversefunc, decreasing, domain=[-1, 1])
+
+def test_inverse_from_samples():
+    import os
+    import pickle
+    import shutil
+    import tempfile
+    from pynverse import inverse_from_samples, InverseFunction
+    x = np.linspace(0, 3, 301)
+    yval = np.linspace(0.1, 9., 25)
+    for kind, accuracy in [('linear', 3), ('pchip', 6)]:
+        invfunc = inverse_from_samples(x, x**2, kind=kind)
+        assert_array_almost_equal(invfunc(yval), np.sqrt(yval), accuracy)
+        assert_array_almost_equal(invfunc(x**2), x)
+        invfunc = inverse_from_samples(x, np.exp(-x), kind=kind)
+        assert_array_almost_equal(invfunc(np.exp(-yval / 3.)), yval / 3.,
+                                  accuracy)
+    assert_equal(inverse_from_samples(x, np.exp(-x)).trend, -1)
+    assert_raises(ValueError, inverse_from_samples(x, x**2), [-1., 1.])
+    assert_raises(ValueError, inverse_from_samples, x, np.cos(2 * x))
+    assert_raises(ValueError, inverse_from_samples, x[::-1], x)
+    assert_raises(ValueError, inverse_from_samples, x, x, trend=-1)
+    assert_raises(ValueError, inverse_from_samples, x, x, kind='cubic')
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        xpath = os.path.join(tmpdir, 'x.npy')
+        ypath = os.path.join(tmpdir, 'y.npy')
+        np.save(xpath, x)
+        np.save(ypath, 1. - x**3)
+        expected = inverse_from_samples(x, 1. - x**3, kind='pchip')(yval - 8)
+        # Memory maps, read in chunks smaller than the samples
+        invfunc = inverse_from_samples(np.load(xpath, mmap_mode='r'),
+                                       ypath, kind='pchip', chunk_size=16)
+        assert_(isinstance(invfunc.table.y, np.memmap))
+        assert_array_almost_equal(invfunc(yval - 8), expected, 12)
+        invfunc.save(os.path.join(tmpdir, 'inverse'))
+        loaded = InverseFunction.load(os.path.join(tmpdir, 'inverse'))
+        assert_array_almost_equal(loaded(yval - 8), expected, 12)
+        assert_array_almost_equal(loaded.func(x), 1. - x**3)
+        loaded = pickle.loads(pickle.dumps(invfunc))
+        assert_array_almost_equal(loaded(yval - 8), expected, 12)
+        del invfunc, loaded
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_inverse_from_samples_chunks():
+    from pynverse._samples import _chunked_pchip_slopes
+    from pynverse._tables import _pchip_slopes
+    # The last chunk may hold a single sample, and the first one two
+    for n, chunk_size in [(33, 16), (17, 16), (34, 16), (5, 1), (7, 2)]:
+        x = np.linspace(0, 3, n)
+        y = np.exp(x)
+        assert_array_almost_equal(_chunked_pchip_slopes(y, x, chunk_size),
+                                  _pchip_slopes(y, x), 14)
+
+def test_inversefunc_batch_shape():
+    evaluated = []
+    scale = np.array([1., 2., -3.])
+
+    def cubes(x):
+        evaluated.append(x.shape)
+        return scale.reshape((3,) + (1,) * (x.ndim - 1)) * x**3
+    invfunc = inversefunc(cubes, batch_shape=3,
+                          domain=[[-10., 0., -5.], None])
+    assert_array_equal(invfunc.trend, [1, 1, -1])
+    assert_array_equal(invfunc.ymin, [-1000., 0., -np.inf])
+    assert_array_equal(invfunc.ymax, [np.inf, np.inf, 375.])
+    xvalexpected = np.array([[2., 3., 0.5], [2., 1., 0.], [2., -1., 4.]])
+    yval = cubes(xvalexpected)
+    del evaluated[:]
+    xval, info = invfunc(yval, full_output=True)
+    assert_array_almost_equal(xval, xvalexpected)
+    # A single call with all the values per iteration, plus verification
+    assert_equal(set(evaluated), set([yval.shape]))
+    assert_(len(evaluated) <= (info['nfev'] - info['nit']).max() +
+            info['nit'].max() + 1)
+    assert_array_almost_equal(invfunc([8., 16., -24.]), [2., 2., 2.])
+    assert_raises(ValueError, invfunc, [[1.], [-1.], [1.]])
+    assert_raises(ValueError, invfunc, np.ones((2, 4)))
+
+    def dcubes(x):
+        return 3 * scale.reshape((3,) + (1,) * (x.ndim - 1)) * x**2
+    invfunc = inversefunc(cubes, batch_shape=(3,), fprime=dcubes,
+                          image=[None, [1e3, 1e3, 1e3]])
+    assert_array_almost_equal(invfunc(yval[:, :2]), xvalexpected[:, :2])
+    assert_raises(ValueError, invfunc, [[1e4], [1.], [1.]])
+    # Flattened chunks would mix up the channels
+    assert_raises(ValueError, invfunc.iter_chunks, [yval], chunk_size=3)
+    assert_raises(ValueError, invfunc.map_file, 'in.npy', 'out.npy')
+    assert_raises(ValueError, invfunc.solve_async, yval, chunk_size=3)
+    assert_raises(ValueError, inversefunc, cubes, batch_shape=3,
+                  method='brent')
+    assert_raises(ValueError, inversefunc, cubes, batch_shape=3,
+                  domain=[[0., 1.], None])
@@ -1,6 +1,6 @@
 import numpy as np
 
-__all__ = ['piecewise']
+__all__ = ['piecewise', 'Piecewise']
 
 def piecewise(x, condlist, *args, **kwargs):
     x = np.asarray(x)
@@ -9,3 +9,85 @@ def piecewise(x, condlist, *args, **kwargs):
     condlist = [np.asarray(c).flatten() for c in condlist]
     xout = np.piecewise(x, condlist, *args, **kwargs)
     return xout.reshape(shape)
+
+
+class Piecewise(object):
+    r"""Piecewise function defined by its breakpoints.
+
+    Unlike `piecewise`, each of the functions is only evaluated at the
+    points of its own segment, found with a single `np.searchsorted` on the
+    breakpoints, and `inversefunc` inverts each of the segments separately,
+    using the analytic inverse of the segments where one is given.
+
+    Parameters
+    ----------
+    breakpoints : float, ndarray
+        Strictly increasing points `b` where the segments start. The
+        segment 0 is x < `b[0]`, the segment i is `b[i-1]` <= x < `b[i]`,
+        and the last one is x >= `b[-1]`.
+    funclist : list of callables
+        Function of each of the segments, one more than breakpoints,
+        called as `funclist[i](x, *args)` with the points of the segment.
+    inverses : list of callables or None, optional
+        Analytic inverse of the functions of each of the segments, called
+        as `inverses[i](y, *args)`, or None for the segments without one.
+        Default None.
+
+    Examples
+    --------
+    >>> from pynverse import inversefunc, Piecewise
+    >>> pw = Piecewise([1, 3], [lambda x: x, lambda x: x**2,
+    ...                         lambda x: x + 6],
+    ...                inverses=[lambda y: y, None, lambda y: y - 6])
+    >>> inversefunc(pw, y_values=[0.5, 4, 10])
+    array([ 0.5,  2. ,  4. ])
+
+    """
+
+    def __init__(self, breakpoints, funclist, inverses=None):
+        breakpoints = np.atleast_1d(np.asarray(breakpoints,
+                                               dtype=np.float64))
+        if breakpoints.ndim != 1 or not np.isfinite(breakpoints).all():
+            raise ValueError("breakpoints must be a 1-D array of finite "
+                             "values")
+        if (np.diff(breakpoints) <= 0).any():
+            raise ValueError("breakpoints must be strictly increasing")
+        nsegments = breakpoints.size + 1
+        if len(funclist) != nsegments:
+            raise ValueError("funclist must have one function more than "
+                             "breakpoints")
+        if inverses is None:
+            inverses = [None] * nsegments
+        if len(inverses) != nsegments:
+            raise ValueError("inverses must have one item for each of the "
+                             "functions")
+        self.breakpoints = breakpoints
+        self.funclist = list(funclist)
+        self.inverses = list(inverses)
+
+    def segment(self, x):
+        """Index of the segment of each of the points."""
+        return np.searchsorted(self.breakpoints, x, side='right')
+
+    def __call__(self, x, *args):
+        x = np.asarray(x, dtype=np.float64)
+        shape = x.shape
+        x = x.reshape(-1)
+        args = [np.broadcast_to(a, shape).reshape(-1) if np.ndim(a) else a
+                for a in args]
+        out = np.empty(x.shape)
+        for i, idx in _segments(self.segment(x), len(self.funclist)):
+            argsidx = [a[idx] if np.ndim(a) else a for a in args]
+            out[idx] = self.funclist[i](x[idx], *argsidx)
+        out = out.reshape(shape)
+        return out[()] if out.ndim == 0 else out
+
+
+def _segments(index, nsegments):
+    # Yields each of the segments with elements, and the indices of the
+    # elements of `index` in it, sorting the elements by segment once
+    order = np.argsort(index, kind='mergesort')
+    counts = np.bincount(index, minlength=nsegments)
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    for i in np.flatnonzero(counts):
+        yield i, order[bounds[i]:bounds[i + 1]]
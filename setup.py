@@ -29,7 +29,8 @@ setup(
             'Programming Language :: Python :: 3.5',
     ],
     test_suite='nose.collector',
-    install_requires=['scipy>=0.11', 'numpy>=1.6'],
-    setup_requires=['nose>=1.0', 'scipy>=0.11', 'numpy>=1.6'],
+    install_requires=['numpy>=1.6'],
+    extras_require={'scipy': ['scipy>=0.11']},
+    setup_requires=['nose>=1.0', 'numpy>=1.6'],
     tests_require=['nose>=1.0', 'scipy>=0.11', 'numpy>=1.6'],
 )
\ No newline at end of file